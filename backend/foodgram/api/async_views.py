@@ -0,0 +1,60 @@
+from functools import wraps
+from time import perf_counter
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from .middleware import recording
+from .utils import close_unusable_connections
+
+ASYNC_ROUTE_NAMES = (
+    'Tags-list', 'Tags-detail',
+    'ingredients-list', 'ingredients-detail',
+    'recipes-list', 'recipes-detail', 'recipes-download-shopping-cart',
+)
+
+
+def _run_view(view, request, *args, **kwargs):
+    # Поток из пула работает со своими соединениями, поэтому метрики
+    # запроса подключаются к ним здесь, а рендеринг засекается сам.
+    recorder = getattr(request, 'metrics', None)
+    try:
+        close_unusable_connections()
+        with recording(recorder):
+            response = view(request, *args, **kwargs)
+            if response.streaming:
+                response.streaming_content = list(
+                    response.streaming_content)
+            elif hasattr(response, 'render'):
+                started = perf_counter()
+                response.render()
+                if recorder is not None:
+                    recorder.render_duration += perf_counter() - started
+        return response
+    finally:
+        close_old_connections()
+
+
+def as_async_view(view):
+    """Асинхронный вариант синхронной вьюхи.
+
+    Django 3.2 выполняет синхронные вьюхи под ASGI в одном общем потоке,
+    а асинхронного ORM в нём нет. Здесь вьюха, рендеринг ответа и чтение
+    потокового содержимого выполняются в пуле потоков, поэтому запросы
+    обрабатываются параллельно, а цикл событий только отдаёт готовые байты.
+    """
+    run = sync_to_async(_run_view, thread_sensitive=False)
+
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        return await run(view, request, *args, **kwargs)
+
+    return async_view
+
+
+def make_async(urlpatterns):
+    """Заменяет вьюхи маршрутов из ASYNC_ROUTE_NAMES асинхронными."""
+    for pattern in urlpatterns:
+        if pattern.name in ASYNC_ROUTE_NAMES:
+            pattern.callback = as_async_view(pattern.callback)
+    return urlpatterns
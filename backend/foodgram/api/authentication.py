@@ -0,0 +1,30 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import get_token_user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену с кешированием пользователя.
+
+    id и флаг is_active пользователя хранятся в кеше auth и сбрасываются
+    сигналами при удалении токена и сохранении пользователя. Сброс
+    доходит только до общего кеша, поэтому с LocMem на нескольких
+    воркерах запись живёт не дольше короткого AUTH_CACHE_TIMEOUT.
+    """
+
+    def load_user(self, key):
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        return token.user
+
+    def authenticate_credentials(self, key):
+        user = get_token_user(key, self.load_user)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        return user, key
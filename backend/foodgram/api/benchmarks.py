@@ -0,0 +1,59 @@
+from math import ceil
+from statistics import mean
+from time import perf_counter
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(timings):
+    """Сводка по замерам в секундах: перцентили в миллисекундах и RPS."""
+    total = sum(timings)
+    return {
+        'count': len(timings),
+        'mean_ms': round(mean(timings) * 1000, 3) if timings else 0.0,
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        'rps': round(len(timings) / total, 1) if total else 0.0,
+    }
+
+
+def measure(func, arguments):
+    """Вызывает func для каждого аргумента и возвращает время вызовов."""
+    timings = []
+    for argument in arguments:
+        started = perf_counter()
+        func(argument)
+        timings.append(perf_counter() - started)
+    return timings
+
+
+def format_summary(name, summary):
+    return (f"{name}: {summary['count']} запросов, "
+            f"p50={summary['p50_ms']} мс, p95={summary['p95_ms']} мс, "
+            f"p99={summary['p99_ms']} мс, {summary['rps']} запросов/с")
+
+
+def bulk_create_batched(model, objects, batch_size):
+    """Создаёт объекты из итератора пачками по batch_size.
+
+    В отличие от bulk_create(batch_size=...) не собирает весь итератор в
+    список. Возвращает число созданных строк.
+    """
+    count = 0
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) == batch_size:
+            model.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    model.objects.bulk_create(batch)
+    return count + len(batch)
@@ -0,0 +1,174 @@
+from hashlib import md5, sha256
+from time import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db import router, transaction
+
+from recipes.models import ShoppingCart
+
+User = get_user_model()
+
+INGREDIENTS_VERSION_KEY = 'ingredients_version'
+TAGS_VERSION_KEY = 'tags_version'
+SHOPPING_CART_VERSION_KEY = 'shopping_cart_version:{}'
+SHOPPING_CART_KEY = 'shopping_cart:{}:{}'
+RECIPE_VERSION_KEY = 'recipe_version:{}'
+AUTHOR_VERSION_KEY = 'author_version:{}'
+RECIPE_KEY = 'recipe_detail:{}:{}'
+AUTH_TOKEN_KEY = 'auth_token:{}'
+
+
+def _version(key):
+    return _versions([key])
+
+
+def _versions(keys):
+    """Токены версий, недостающие создаются.
+
+    Токены хранятся в общем для всех процессов кеше versions. Сброс
+    версии — это удаление ключа, поэтому вытеснение токена из кеша не
+    может вернуть устаревшие данные. Недостающие токены добавляются через
+    add и перечитываются одним get_many: если другой процесс успел
+    добавить свой, берётся его токен. Токен начинается с времени
+    создания, см. version_timestamp.
+    """
+    versions_cache = caches['versions']
+    found = versions_cache.get_many(keys)
+    missing = {key: f'{time():.6f}:{uuid4().hex}'
+               for key in keys if key not in found}
+    if missing:
+        for key, version in missing.items():
+            versions_cache.add(key, version)
+        found.update(missing)
+        found.update(versions_cache.get_many(list(missing)))
+    return ':'.join(found[key] for key in keys)
+
+
+def version_timestamp(version):
+    """Время создания токена версии, не раньше последнего изменения."""
+    return int(float(version.split(':', 1)[0]))
+
+
+def _invalidate(keys, using='versions'):
+    keys = list(keys)
+    if keys:
+        transaction.on_commit(lambda: caches[using].delete_many(keys))
+
+
+def get_ingredients_version():
+    return _version(INGREDIENTS_VERSION_KEY)
+
+
+def invalidate_ingredients():
+    """Сбрасывает версию справочника ингредиентов после коммита."""
+    _invalidate([INGREDIENTS_VERSION_KEY])
+
+
+def get_tags_version():
+    return _version(TAGS_VERSION_KEY)
+
+
+def invalidate_tags():
+    """Сбрасывает версию справочника тегов после коммита."""
+    _invalidate([TAGS_VERSION_KEY])
+
+
+def _caching_iterator(rows, key):
+    cached = []
+    for row in rows:
+        cached.append(row)
+        yield row
+    cache.set(key, cached, settings.SHOPPING_CART_CACHE_TIMEOUT)
+
+
+def get_shopping_cart(user_id, queryset):
+    """Возвращает строки списка покупок пользователя.
+
+    Ключ включает версии корзины пользователя и справочника ингредиентов,
+    чтобы переименование ингредиента или смена единицы измерения не
+    оставляли в кеше старые строки. При промахе строки читаются из
+    кверисета потоком и попадают в кеш после полной выгрузки.
+    """
+    versions = _versions([SHOPPING_CART_VERSION_KEY.format(user_id),
+                          INGREDIENTS_VERSION_KEY])
+    key = SHOPPING_CART_KEY.format(user_id,
+                                   md5(versions.encode()).hexdigest())
+    rows = cache.get(key)
+    if rows is not None:
+        return iter(rows)
+    return _caching_iterator(queryset.iterator(), key)
+
+
+def invalidate_shopping_carts(user_ids):
+    """Сбрасывает кеш списка покупок после коммита транзакции."""
+    _invalidate(SHOPPING_CART_VERSION_KEY.format(user_id)
+                for user_id in set(user_ids))
+
+
+def invalidate_recipe_shopping_carts(recipe_id):
+    """Сбрасывает кеш у всех, у кого рецепт лежит в корзине."""
+    invalidate_shopping_carts(ShoppingCart.objects.filter(
+        recipe=recipe_id).values_list('user_id', flat=True))
+
+
+def get_recipe_data(recipe, build):
+    """Возвращает общую для всех пользователей часть представления рецепта.
+
+    Ключ включает версии рецепта, его автора и справочников тегов и
+    ингредиентов. Данные хранятся в кеше recipes, который при
+    переполнении вытесняет давно не читавшиеся записи.
+    """
+    versions = _versions([RECIPE_VERSION_KEY.format(recipe.pk),
+                          AUTHOR_VERSION_KEY.format(recipe.author_id),
+                          TAGS_VERSION_KEY, INGREDIENTS_VERSION_KEY])
+    key = RECIPE_KEY.format(recipe.pk, md5(versions.encode()).hexdigest())
+    recipes_cache = caches['recipes']
+    data = recipes_cache.get(key)
+    if data is None:
+        data = build()
+        recipes_cache.set(key, data)
+    return data
+
+
+def invalidate_recipes(recipe_ids):
+    """Сбрасывает кеш представления рецептов после коммита."""
+    _invalidate(RECIPE_VERSION_KEY.format(recipe_id)
+                for recipe_id in set(recipe_ids))
+
+
+def invalidate_authors(user_ids):
+    """Сбрасывает кеш представления рецептов авторов после коммита."""
+    _invalidate(AUTHOR_VERSION_KEY.format(user_id)
+                for user_id in set(user_ids))
+
+
+def _token_key(key):
+    return AUTH_TOKEN_KEY.format(sha256(key.encode()).hexdigest())
+
+
+def get_token_user(key, load):
+    """Возвращает пользователя по ключу токена из кеша auth.
+
+    В кеше лежат только id пользователя и флаг is_active: ни хеш пароля,
+    ни другие поля туда не попадают. Из них собирается экземпляр с
+    отложенными полями, которые читаются из базы при первом обращении.
+    При промахе пользователь читается через load. Сам ключ токена в кеш
+    не попадает, только его хеш.
+    """
+    auth_cache = caches['auth']
+    cache_key = _token_key(key)
+    cached = auth_cache.get(cache_key)
+    if cached is None:
+        user = load(key)
+        auth_cache.set(cache_key, (user.pk, user.is_active))
+        return user
+    return User.from_db(router.db_for_read(User),
+                        [User._meta.pk.attname, 'is_active'], list(cached))
+
+
+def invalidate_tokens(keys):
+    """Сбрасывает закешированных пользователей токенов после коммита."""
+    _invalidate((_token_key(key) for key in set(keys)), using='auth')
@@ -0,0 +1,173 @@
+from base64 import b64decode
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+from .images import strip_metadata
+from .utils import file_digest
+
+BASE64_CHUNK_SIZE = 64 * 1024
+BASE64_WHITESPACE = ('\n', '\r', ' ', '\t')
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    """Картинка строкой data:image/...;base64 или файлом multipart.
+
+    base64 декодируется кусками во временный файл, а не вторым буфером в
+    памяти. Размер проверяется до декодирования, размеры в пикселях — по
+    заголовку до разбора всего изображения. Сохраняется копия без
+    метаданных, в её атрибуте digest — SHA-256 загруженных байт. Ссылка
+    вместо картинки пропускается, как в Base64ImageField.
+    """
+    default_error_messages = {
+        'invalid_base64': 'Некорректные данные изображения в base64.',
+        'too_large': 'Размер изображения не должен превышать '
+                     '{max_size} байт.',
+        'too_many_pixels': 'Изображение не должно быть больше '
+                           '{max_pixels} пикселей.',
+    }
+
+    def decode(self, data):
+        header, _, encoded = data.partition(';base64,')
+        if not header.startswith('data:') or not encoded:
+            self.fail('invalid_base64')
+        whitespace = sum(map(encoded.count, BASE64_WHITESPACE))
+        if ((len(encoded) - whitespace) // 4 * 3
+                > settings.RECIPE_IMAGE_MAX_BYTES):
+            self.fail('too_large', max_size=settings.RECIPE_IMAGE_MAX_BYTES)
+        content_type = header[len('data:'):]
+        extension = ''.join(filter(str.isalnum, content_type.split('/')[-1]))
+        upload = TemporaryUploadedFile(
+            f'{uuid4()}.{extension}', content_type, 0, None)
+        # Переносы строк (base64 по RFC 2045) вырезаются из каждого куска,
+        # а хвост, не кратный четырём символам, переходит в следующий.
+        leftover = ''
+        try:
+            for start in range(0, len(encoded), BASE64_CHUNK_SIZE):
+                chunk = leftover + ''.join(
+                    encoded[start:start + BASE64_CHUNK_SIZE].split())
+                end = len(chunk) - len(chunk) % 4
+                upload.write(b64decode(chunk[:end], validate=True))
+                leftover = chunk[end:]
+            upload.write(b64decode(leftover, validate=True))
+        except ValueError:
+            upload.close()
+            self.fail('invalid_base64')
+        upload.size = upload.tell()
+        upload.seek(0)
+        return upload
+
+    def check_limits(self, upload):
+        if upload.size > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.fail('too_large', max_size=settings.RECIPE_IMAGE_MAX_BYTES)
+        try:
+            width, height = Image.open(upload).size
+        except Image.DecompressionBombError:
+            self.fail('too_many_pixels',
+                      max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS)
+        except (OSError, ValueError):
+            self.fail('invalid_image')
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.fail('too_many_pixels',
+                      max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS)
+        upload.seek(0)
+
+    def to_internal_value(self, data):
+        decoded = isinstance(data, str)
+        if decoded:
+            if data.startswith('http'):
+                raise SkipField()
+            data = self.decode(data)
+        try:
+            if hasattr(data, 'size'):
+                self.check_limits(data)
+            image = super().to_internal_value(data)
+            # Пересохранение не побайтовое, поэтому хеш для сравнения с
+            # прежней картинкой берётся до него.
+            digest = file_digest(image)
+            # Исходник отдаётся из media как есть, поэтому EXIF с
+            # координатами съёмки вырезается до сохранения.
+            stripped = strip_metadata(image)
+            stripped.digest = digest
+            return stripped
+        except (OSError, ValueError):
+            self.fail('invalid_image')
+        finally:
+            if decoded:
+                data.close()
+
+
+class RecipeImageField(serializers.Field):
+    """Ссылка на вариант изображения рецепта.
+
+    Пока варианты не построены, отдаётся исходная картинка.
+    """
+
+    def __init__(self, rendition, image_format='jpeg', **kwargs):
+        self.rendition = rendition
+        self.image_format = image_format
+        kwargs.setdefault('source', '*')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def build_url(self, path):
+        url = default_storage.url(path)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    @staticmethod
+    def get_renditions(recipe):
+        """Варианты, построенные из текущей картинки рецепта."""
+        renditions = recipe.image_renditions
+        if renditions.get('source') != recipe.image.name:
+            return {}
+        return {name: variant for name, variant in renditions.items()
+                if name != 'source'}
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        rendition = self.get_renditions(recipe).get(self.rendition)
+        if rendition is None:
+            return self.build_url(recipe.image.name)
+        return self.build_url(rendition[self.image_format])
+
+
+class RecipeImageSrcsetField(RecipeImageField):
+    """Значение srcset из всех вариантов изображения рецепта."""
+
+    def __init__(self, image_format='webp', **kwargs):
+        super().__init__(None, image_format, **kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return ''
+        variants = sorted(self.get_renditions(recipe).values(),
+                          key=lambda variant: variant['width'])
+        return ', '.join(
+            f'{self.build_url(variant[self.image_format])} '
+            f'{variant["width"]}w'
+            for variant in variants
+        )
+
+
+def absolute_image_urls(data, request):
+    """Делает ссылки image и image_srcset в представлении абсолютными.
+
+    Для кешируемых представлений: в кеш попадают относительные ссылки,
+    а хост подставляется из текущего запроса.
+    """
+    if data.get('image'):
+        data['image'] = request.build_absolute_uri(data['image'])
+    if data.get('image_srcset'):
+        data['image_srcset'] = ', '.join(
+            f'{request.build_absolute_uri(url)} {width}'
+            for url, width in (variant.rsplit(' ', 1) for variant
+                               in data['image_srcset'].split(', '))
+        )
+    return data
@@ -1,7 +1,37 @@
 from django_filters import rest_framework as filters
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
 
 from recipes.models import Recipe, Tag
 
+from .search import ingredient_index
+
+
+class IngredientSearchFilter(BaseFilterBackend):
+    """Поиск ингредиентов по индексу в памяти.
+
+    Совпадения по началу названия идут раньше совпадений по вхождению,
+    параметр limit ограничивает выдачу.
+    """
+    search_param = api_settings.SEARCH_PARAM
+    limit_param = 'limit'
+
+    def get_limit(self, request):
+        limit = request.query_params.get(self.limit_param, '')
+        if limit.isdigit() and int(limit) > 0:
+            return int(limit)
+        return None
+
+    def filter_queryset(self, request, queryset, view):
+        if view.action != 'list':
+            return queryset
+        query = request.query_params.get(self.search_param, '').strip()
+        limit = self.get_limit(request)
+        if query:
+            return ingredient_index.search(
+                query, limit, getattr(view, 'version', None))
+        return queryset[:limit]
+
 
 class RecipeFilter(filters.FilterSet):
     tags = filters.ModelMultipleChoiceFilter(field_name='tags__slug',
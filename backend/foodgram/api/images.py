@@ -0,0 +1,184 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+
+from .cache import invalidate_recipes
+from .utils import file_digest
+
+RENDITIONS_PATH = 'recipes/renditions/{}/{}-{}.{}'
+FORMATS = (('webp', 'WEBP'), ('jpeg', 'JPEG'))
+ORIENTATION_TAG = 0x0112
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = Lock()
+
+
+def _open(image_file):
+    """Открывает изображение с учётом EXIF-поворота и без альфа-канала."""
+    with image_file.open('rb'):
+        image = Image.open(image_file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def strip_metadata(image_file):
+    """Пересохраняет картинку без метаданных во временный файл.
+
+    Исходник доступен по прямой ссылке из media, поэтому EXIF (в том
+    числе координаты GPS) и комментарии в нём не сохраняются. Поворот из
+    EXIF применяется к пикселям, ICC-профиль остаётся. JPEG без поворота
+    пересохраняется с исходными таблицами квантования.
+    """
+    image_file.seek(0)
+    with Image.open(image_file) as image:
+        image_format = image.format
+        options = {'exif': b'', 'comment': b''}
+        if image.info.get('icc_profile'):
+            options['icc_profile'] = image.info['icc_profile']
+        if getattr(image, 'n_frames', 1) > 1:
+            options['save_all'] = True
+        elif image.getexif().get(ORIENTATION_TAG, 1) != 1:
+            image = ImageOps.exif_transpose(image)
+            if image_format == 'JPEG':
+                options['quality'] = settings.RECIPE_IMAGE_QUALITY
+        elif image_format == 'JPEG':
+            options.update(quality='keep', subsampling='keep')
+        stripped = TemporaryUploadedFile(
+            image_file.name, Image.MIME.get(image_format), 0, None)
+        image.save(stripped, image_format, **options)
+    stripped.size = stripped.tell()
+    stripped.seek(0)
+    return stripped
+
+
+def strip_recipe_image(recipe_id):
+    """Заменяет исходную картинку рецепта копией без метаданных.
+
+    Копия сохраняется под новым именем, так что варианты изображения
+    перестраиваются, а закешированные ссылки на старый файл сбрасываются.
+    Хеш берётся от старого файла: с ним сравнивается повторная загрузка.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return False
+    old_name = recipe.image.name
+    with recipe.image.open('rb'):
+        digest = file_digest(recipe.image)
+        stripped = strip_metadata(recipe.image)
+    try:
+        name = default_storage.save(old_name, stripped)
+    finally:
+        stripped.close()
+    updated = Recipe.objects.filter(
+        pk=recipe.pk, image=old_name).update(image=name, image_digest=digest)
+    default_storage.delete(old_name if updated else name)
+    if updated:
+        invalidate_recipes([recipe.pk])
+    return bool(updated)
+
+
+def render(image_file, prefix):
+    """Сохраняет варианты изображения и возвращает их описание.
+
+    Каждый вариант ужимается до размера из RECIPE_IMAGE_RENDITIONS и
+    сохраняется в WebP и JPEG. Метаданные исходника (EXIF, ICC) в
+    варианты не переносятся.
+    """
+    image = _open(image_file)
+    token = uuid4().hex[:8]
+    renditions = {'source': image_file.name}
+    for name, size in settings.RECIPE_IMAGE_RENDITIONS.items():
+        variant = image.copy()
+        variant.thumbnail((size, size))
+        renditions[name] = {'width': variant.width,
+                            'height': variant.height}
+        for extension, image_format in FORMATS:
+            buffer = BytesIO()
+            variant.save(buffer, image_format,
+                         quality=settings.RECIPE_IMAGE_QUALITY,
+                         optimize=True)
+            renditions[name][extension] = default_storage.save(
+                RENDITIONS_PATH.format(prefix, name, token, extension),
+                ContentFile(buffer.getvalue())
+            )
+    return renditions
+
+
+def rendition_paths(renditions):
+    return [variant[extension]
+            for name, variant in renditions.items() if name != 'source'
+            for extension, _ in FORMATS if extension in variant]
+
+
+def process_recipe_image(recipe_id):
+    """Строит варианты изображения рецепта и сохраняет их описание.
+
+    Если пока шла обработка картинку рецепта заменили, результат
+    выбрасывается: за новой картинкой уже поставлена своя задача.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'image', 'image_renditions').first()
+    if recipe is None or not recipe.image:
+        return
+    renditions = render(recipe.image, recipe.pk)
+    updated = Recipe.objects.filter(
+        pk=recipe.pk, image=recipe.image.name
+    ).update(image_renditions=renditions)
+    stale = recipe.image_renditions if updated else renditions
+    for path in rendition_paths(stale):
+        default_storage.delete(path)
+    if updated:
+        invalidate_recipes([recipe.pk])
+
+
+def _run(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать изображение рецепта %s',
+                         recipe_id)
+    finally:
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='recipe-images'
+            )
+    return _executor
+
+
+def schedule_recipe_image(recipe_id):
+    """Ставит обработку изображения в очередь после коммита.
+
+    При IMAGE_WORKERS = 0 изображение обрабатывается сразу, в том же
+    потоке.
+    """
+    if settings.IMAGE_WORKERS:
+        transaction.on_commit(
+            lambda: _get_executor().submit(_run, recipe_id))
+    else:
+        transaction.on_commit(lambda: process_recipe_image(recipe_id))
@@ -0,0 +1,43 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Ingredient
+
+from ...benchmarks import format_summary, measure, summarize
+from ...search import ingredient_index
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает поиск ингредиентов по индексу в памяти с запросом '
+            'к базе на запросах, набираемых по одной букве.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--words', type=int, default=200,
+                            help='Сколько названий «набрать» по буквам.')
+        parser.add_argument('--limit', type=int, default=10,
+                            help='Ограничение выдачи, как у параметра limit.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            self.stderr.write('Справочник ингредиентов пуст.')
+            return
+        rnd = random.Random(options['seed'])
+        words = rnd.sample(names, min(options['words'], len(names)))
+        queries = [word[:length] for word in words
+                   for length in range(1, len(word) + 1)]
+        limit = options['limit']
+
+        ingredient_index.search('', 1)
+        index = summarize(measure(
+            lambda query: ingredient_index.search(query, limit), queries))
+        database = summarize(measure(
+            lambda query: list(Ingredient.objects.filter(
+                name__istartswith=query)[:limit]),
+            queries))
+
+        self.stdout.write(format_summary('Индекс в памяти', index))
+        self.stdout.write(format_summary('База данных (istartswith)',
+                                         database))
@@ -0,0 +1,100 @@
+import random
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import (AmountIngredient, Favorite, Ingredient, Recipe,
+                            ShoppingCart)
+from users.models import User
+
+from ...benchmarks import (bulk_create_batched, format_summary, measure,
+                           summarize)
+
+
+class Command(BaseCommand):
+    help = ('Замеряет фильтры избранного и корзины и выгрузку списка '
+            'покупок на синтетических данных. Данные создаются в '
+            'транзакции и откатываются. Запустите до и после миграции '
+            'recipes 0007, чтобы увидеть эффект индексов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000,
+                            help='Число строк в Favorite и ShoppingCart.')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--explain', action='store_true',
+                            help='Показать планы запросов.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(**options)
+            transaction.set_rollback(True)
+        self.stdout.write('Синтетические данные удалены.')
+
+    def run(self, rows, queries, batch_size, explain, seed, **options):
+        rnd = random.Random(seed)
+        side = max(int(rows ** 0.5), 1)
+        started = perf_counter()
+        User.objects.bulk_create(
+            User(username=f'bench_{i}', email=f'bench_{i}@example.com')
+            for i in range(side)
+        )
+        users = list(User.objects.filter(
+            username__startswith='bench_').values_list('pk', flat=True))
+        Recipe.objects.bulk_create(
+            Recipe(author_id=users[i % side], name=f'bench_{i}', text='',
+                   cooking_time=1)
+            for i in range(side)
+        )
+        recipes = list(Recipe.objects.filter(
+            name__startswith='bench_').values_list('pk', flat=True))
+        ingredients = list(Ingredient.objects.values_list('pk', flat=True))
+        bulk_create_batched(AmountIngredient, (
+            AmountIngredient(recipe_id=recipe, ingredient_id=ingredient,
+                             amount=rnd.randint(1, 500))
+            for recipe in recipes
+            for ingredient in rnd.sample(ingredients,
+                                         min(8, len(ingredients)))
+        ), batch_size)
+        bulk_create_batched(Favorite, (
+            Favorite(user_id=user, recipe_id=recipe)
+            for user in users for recipe in recipes
+        ), batch_size)
+        bulk_create_batched(ShoppingCart, (
+            ShoppingCart(user_id=user, recipe_id=recipe)
+            for user in users for recipe in recipes[::10]
+        ), batch_size)
+        self.stdout.write(
+            f'Данные созданы за {perf_counter() - started:.1f} с: '
+            f'{len(users) * len(recipes)} строк избранного.')
+
+        sample = [rnd.choice(users) for _ in range(queries)]
+        cases = {
+            'filter_is_favorited': lambda user: list(
+                Recipe.objects.filter(favorites__user=user).order_by(
+                    '-pk')[:6]),
+            'filter_is_in_shopping_cart': lambda user: list(
+                Recipe.objects.filter(shopping_carts__user=user).order_by(
+                    '-pk')[:6]),
+            'favorite exists': lambda user: Favorite.objects.filter(
+                user=user, recipe=rnd.choice(recipes)).exists(),
+            'download_shopping_cart': lambda user: list(
+                self.shopping_cart(user)),
+        }
+        for name, case in cases.items():
+            self.stdout.write(format_summary(name,
+                                             summarize(measure(case, sample))))
+        if explain:
+            self.stdout.write(Recipe.objects.filter(
+                favorites__user=sample[0]).order_by('-pk')[:6].explain())
+            self.stdout.write(self.shopping_cart(sample[0]).explain())
+
+    def shopping_cart(self, user):
+        return AmountIngredient.objects.filter(
+            recipe__shopping_carts__user=user).values(
+            'ingredient__name', 'ingredient__measurement_unit').annotate(
+                amount=Sum('amount')).order_by(
+                    'ingredient__measurement_unit', 'ingredient__name')
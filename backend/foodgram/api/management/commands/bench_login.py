@@ -0,0 +1,68 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from users.models import User
+
+from ...benchmarks import format_summary, measure, summarize
+from ...views import TokenCreateViewSet
+
+EMAIL = 'bench-login@example.com'
+PASSWORD = 'bench-login-password'
+
+
+class Command(BaseCommand):
+    help = ('Замеряет пропускную способность входа: успешный вход, '
+            'неверный пароль и отказ троттлинга до проверки пароля.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Сколько запросов на каждый сценарий.')
+        parser.add_argument('--iterations', type=int,
+                            help='Число итераций PBKDF2 вместо '
+                                 'PASSWORD_HASH_ITERATIONS.')
+
+    def handle(self, *args, **options):
+        overrides = {}
+        if options['iterations']:
+            overrides['PASSWORD_HASH_ITERATIONS'] = options['iterations']
+        with override_settings(**overrides), transaction.atomic():
+            self.run(options['requests'])
+            transaction.set_rollback(True)
+
+    def run(self, count):
+        User.objects.create_user(username='bench-login', email=EMAIL,
+                                 password=PASSWORD)
+        factory = APIRequestFactory()
+        unthrottled = TokenCreateViewSet.as_view(throttle_classes=[])
+        throttled = TokenCreateViewSet.as_view()
+
+        def login(view, password):
+            request = factory.post('/api/auth/token/login/',
+                                   {'email': EMAIL.upper(),
+                                    'password': password},
+                                   format='json')
+            return view(request)
+
+        scenarios = (
+            ('Успешный вход', unthrottled, PASSWORD),
+            ('Неверный пароль', unthrottled, 'wrong-password'),
+        )
+        for name, view, password in scenarios:
+            self.stdout.write(format_summary(name, summarize(measure(
+                lambda _: login(view, password), range(count)))))
+
+        while login(throttled, 'wrong-password').status_code != 429:
+            pass
+        self.stdout.write(format_summary('Отказ троттлинга', summarize(
+            measure(lambda _: login(throttled, 'wrong-password'),
+                    range(count)))))
+        cache.delete_many([
+            throttle().get_cache_key(
+                throttled.cls().initialize_request(
+                    factory.post('/', {'email': EMAIL}, format='json')),
+                None)
+            for throttle in TokenCreateViewSet.throttle_classes
+        ])
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+from ...images import process_recipe_image, strip_recipe_image
+
+
+class Command(BaseCommand):
+    help = ('Строит варианты изображений для рецептов, у которых их нет '
+            'или они построены из старой картинки. Загруженные до очистки '
+            'метаданных исходники очищаются с --strip-originals.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Перестроить варианты у всех рецептов.')
+        parser.add_argument('--strip-originals', action='store_true',
+                            help='Заменить исходные картинки копиями без '
+                                 'метаданных (EXIF, GPS) и перестроить '
+                                 'варианты.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True).only('image', 'image_renditions')
+        processed = 0
+        for recipe in recipes.iterator():
+            if (not options['force'] and not options['strip_originals']
+                    and recipe.image_renditions.get(
+                        'source') == recipe.image.name):
+                continue
+            try:
+                if options['strip_originals']:
+                    strip_recipe_image(recipe.pk)
+                process_recipe_image(recipe.pk)
+            except (OSError, ValueError) as error:
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+                continue
+            processed += 1
+        self.stdout.write(f'Обработано рецептов: {processed}')
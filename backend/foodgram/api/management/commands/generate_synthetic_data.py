@@ -0,0 +1,150 @@
+import random
+from itertools import accumulate
+from time import perf_counter
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import (AmountIngredient, Favorite, Follow, Ingredient,
+                            Recipe, ShoppingCart, Tag)
+from users.models import User
+
+from ...benchmarks import bulk_create_batched
+
+PREFIX = 'synthetic_'
+PASSWORD = 'synthetic-password'
+
+
+class Zipf:
+    """Выбор из списка с вероятностью, обратной рангу в степени s."""
+
+    def __init__(self, items, exponent, rnd):
+        self.items = items
+        self.weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(items) + 1)))
+        self.rnd = rnd
+
+    def sample(self, count):
+        """До count разных элементов."""
+        count = min(count, len(self.items))
+        chosen = set()
+        for _ in range(count * 4):
+            chosen.add(self.rnd.choices(self.items,
+                                        cum_weights=self.weights)[0])
+            if len(chosen) == count:
+                break
+        return chosen
+
+
+class Command(BaseCommand):
+    help = ('Создаёт синтетический набор данных: пользователей, рецепты с '
+            'ингредиентами и тегами по закону Ципфа, подписки, избранное '
+            'и корзины. Пользователи получают префикс synthetic_ и пароль '
+            f'{PASSWORD}.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10_000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--follows-per-user', type=int, default=20)
+        parser.add_argument('--favorites-per-user', type=int, default=30)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Показатель распределения Ципфа.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true',
+                            help='Сначала удалить прежние синтетические '
+                                 'данные.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = User.objects.filter(
+                username__startswith=PREFIX).delete()
+            self.stdout.write(f'Удалено объектов: {deleted}')
+        elif User.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError('Синтетические данные уже есть, '
+                               'используйте --clear.')
+        ingredients = list(Ingredient.objects.values_list('pk', flat=True))
+        tags = list(Tag.objects.values_list('pk', flat=True))
+        if not ingredients or not tags:
+            raise CommandError('Нужны ингредиенты и теги.')
+
+        started = perf_counter()
+        with transaction.atomic():
+            self.generate(ingredients, tags, **options)
+        call_command('reconcile_recipe_counters', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {perf_counter() - started:.1f} с.'))
+
+    def report(self, model, count):
+        self.stdout.write(f'{model.__name__}: {count}')
+
+    def generate(self, ingredients, tags, users, recipes, zipf, batch_size,
+                 seed, **options):
+        rnd = random.Random(seed)
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            (User(username=f'{PREFIX}{number}',
+                  email=f'{PREFIX}{number}@example.com',
+                  first_name='Синтетический', last_name=str(number),
+                  password=password)
+             for number in range(users)),
+            batch_size=batch_size
+        )
+        user_ids = list(User.objects.filter(
+            username__startswith=PREFIX).values_list('pk', flat=True))
+        self.report(User, len(user_ids))
+
+        authors = Zipf(user_ids, zipf, rnd)
+        Recipe.objects.bulk_create(
+            (Recipe(author_id=authors.sample(1).pop(),
+                    name=f'{PREFIX}{number}',
+                    text='Синтетический рецепт.',
+                    cooking_time=rnd.randint(5, 180))
+             for number in range(recipes)),
+            batch_size=batch_size
+        )
+        recipe_ids = list(Recipe.objects.filter(
+            author_id__in=user_ids).values_list('pk', flat=True))
+        self.report(Recipe, len(recipe_ids))
+
+        ingredient_zipf = Zipf(ingredients, zipf, rnd)
+        self.bulk(AmountIngredient, (
+            AmountIngredient(recipe_id=recipe, ingredient_id=ingredient,
+                             amount=rnd.randint(1, 500))
+            for recipe in recipe_ids
+            for ingredient in ingredient_zipf.sample(
+                options['ingredients_per_recipe'])
+        ), batch_size)
+        tag_zipf = Zipf(tags, zipf, rnd)
+        self.bulk(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+            for recipe in recipe_ids
+            for tag in tag_zipf.sample(options['tags_per_recipe'])
+        ), batch_size)
+
+        popular_recipes = Zipf(recipe_ids, zipf, rnd)
+        self.bulk(Follow, (
+            Follow(user_id=user, following_id=author)
+            for user in user_ids
+            for author in authors.sample(options['follows_per_user'])
+            if author != user
+        ), batch_size)
+        self.bulk(Favorite, (
+            Favorite(user_id=user, recipe_id=recipe)
+            for user in user_ids
+            for recipe in popular_recipes.sample(
+                options['favorites_per_user'])
+        ), batch_size)
+        self.bulk(ShoppingCart, (
+            ShoppingCart(user_id=user, recipe_id=recipe)
+            for user in user_ids
+            for recipe in popular_recipes.sample(options['carts_per_user'])
+        ), batch_size)
+
+    def bulk(self, model, objects, batch_size):
+        self.report(model, bulk_create_batched(model, objects, batch_size))
@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, sleep
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+
+from ...benchmarks import format_summary, summarize
+
+DEFAULT_PATHS = (
+    '/api/tags/',
+    '/api/ingredients/?name=%D1%81%D0%B0',
+    '/api/recipes/?limit=6',
+    '/api/recipes/download_shopping_cart/',
+)
+
+
+class Command(BaseCommand):
+    help = ('Нагружает запущенный сервер параллельными запросами. Чтобы '
+            'сравнить WSGI и ASGI, запустите команду против обоих режимов '
+            'на одной машине с одинаковыми параметрами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000',
+                            help='Адрес сервера.')
+        parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Сколько запросов на каждый путь.')
+        parser.add_argument('--token', help='Токен для авторизации.')
+        parser.add_argument('--read-rate', type=int, default=0,
+                            help='Скорость чтения ответа в байтах/с, '
+                                 'имитирует медленных клиентов.')
+
+    def fetch(self, url, token, read_rate):
+        request = Request(url)
+        if token:
+            request.add_header('Authorization', f'Token {token}')
+        started = perf_counter()
+        try:
+            with urlopen(request) as response:
+                status = response.status
+                chunk = read_rate or -1
+                while response.read(chunk):
+                    if read_rate:
+                        sleep(1)
+        except HTTPError as error:
+            status = error.code
+        return perf_counter() - started, status
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            url = options['url'].rstrip('/') + path
+            started = perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as executor:
+                results = list(executor.map(
+                    lambda _: self.fetch(url, options['token'],
+                                         options['read_rate']),
+                    range(options['requests'])))
+            elapsed = perf_counter() - started
+            errors = sum(status >= 400 for _, status in results)
+            self.stdout.write(format_summary(
+                path, summarize([timing for timing, _ in results])))
+            self.stdout.write(
+                f'  всего {elapsed:.2f} с, '
+                f'{len(results) / elapsed:.1f} запросов/с при '
+                f'{options["concurrency"]} параллельных, ошибок: {errors}')
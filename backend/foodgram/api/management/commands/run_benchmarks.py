@@ -0,0 +1,121 @@
+import json
+from datetime import datetime, timezone
+from statistics import median
+from time import perf_counter
+from urllib.parse import urlencode
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe
+from users.models import User
+
+from ...benchmarks import format_summary, summarize
+from .generate_synthetic_data import PREFIX
+
+
+def endpoints(recipe, ingredient):
+    """Сценарии замера: имя, нужна ли авторизация, адрес."""
+    return (
+        ('recipes_list_anonymous', False, '/api/recipes/?limit=6'),
+        ('recipes_list', True, '/api/recipes/?limit=6'),
+        ('recipes_list_50', True, '/api/recipes/?limit=50'),
+        ('recipes_favorited', True, '/api/recipes/?is_favorited=1'),
+        ('recipes_in_cart', True, '/api/recipes/?is_in_shopping_cart=1'),
+        ('recipes_by_author', True,
+         f'/api/recipes/?author={recipe.author_id}'),
+        ('recipe_detail', True, f'/api/recipes/{recipe.pk}/'),
+        ('subscriptions', True,
+         '/api/users/subscriptions/?limit=6&recipes_limit=3'),
+        ('download_shopping_cart', True,
+         '/api/recipes/download_shopping_cart/'),
+        ('users_list', True, '/api/users/?limit=50'),
+        ('user_me', True, '/api/users/me/'),
+        ('tags', False, '/api/tags/'),
+        ('ingredients_search', False,
+         '/api/ingredients/?' + urlencode({'name': ingredient.name[:2]})),
+    )
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержки (p50/p95/p99) и число SQL-запросов по '
+            'эндпоинтам API на текущей базе и пишет отчёт в JSON. '
+            'Данные удобно готовить командой generate_synthetic_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', nargs='+', metavar='NAME',
+                            help='Запустить только указанные сценарии.')
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кеши перед каждым запросом.')
+        parser.add_argument('--output', default='benchmark-report.json')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username__startswith=PREFIX).annotate(
+            follows=Count('follower')).order_by('-follows').first()
+        user = user or User.objects.order_by('pk').first()
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        ingredient = Ingredient.objects.order_by('pk').first()
+        if not (user and recipe and ingredient):
+            raise CommandError('Нет данных для замера, запустите '
+                               'generate_synthetic_data.')
+
+        anonymous, authorized = APIClient(), APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        authorized.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        results = {}
+        for name, auth, url in endpoints(recipe, ingredient):
+            if options['only'] and name not in options['only']:
+                continue
+            client = authorized if auth else anonymous
+            results[name] = self.measure(client, url, options)
+            self.stdout.write(format_summary(name, results[name]))
+            self.stdout.write(
+                f"  SQL-запросов: медиана {results[name]['queries_median']}, "
+                f"максимум {results[name]['queries_max']}")
+
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'user': user.username,
+            'iterations': options['iterations'],
+            'cold': options['cold'],
+            'counts': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+            },
+            'endpoints': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f"Отчёт сохранён в {options['output']}"))
+
+    def measure(self, client, url, options):
+        for _ in range(options['warmup']):
+            b''.join(client.get(url))
+        timings, queries, statuses = [], [], set()
+        for _ in range(options['iterations']):
+            if options['cold']:
+                for cache in caches.all():
+                    cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                started = perf_counter()
+                response = client.get(url)
+                b''.join(response)
+                timings.append(perf_counter() - started)
+            queries.append(len(context.captured_queries))
+            statuses.add(response.status_code)
+        return {
+            'url': url,
+            'status': sorted(statuses),
+            **summarize(timings),
+            'queries_median': median(queries),
+            'queries_max': max(queries),
+        }
@@ -0,0 +1,132 @@
+import re
+from collections import defaultdict
+from threading import Lock
+
+from django.conf import settings
+from django.http import HttpResponse
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+IN_LIST = re.compile(r'\((?:%s|\?)(?:,\s*(?:%s|\?))+\)')
+NUMBER = re.compile(r'\b\d+\b')
+STRING = re.compile(r"'(?:[^']|'')*'")
+
+
+def fingerprint(sql):
+    """Текст запроса без значений: списки IN и литералы схлопываются."""
+    sql = IN_LIST.sub('(...)', ' '.join(sql.split()))
+    sql = STRING.sub('?', sql)
+    return NUMBER.sub('?', sql)
+
+
+class MetricsRegistry:
+    """Метрики запросов и SQL в памяти процесса."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.requests = defaultdict(lambda: {
+            'count': 0, 'duration': 0.0, 'queries': 0, 'db_duration': 0.0,
+            'serialize_duration': 0.0, 'render_duration': 0.0,
+            'response_bytes': 0,
+            'buckets': [0] * len(DURATION_BUCKETS),
+        })
+        self.statements = {}
+
+    def record_request(self, labels, duration, queries, db_duration,
+                       serialize_duration, render_duration, response_bytes):
+        with self.lock:
+            stats = self.requests[labels]
+            stats['count'] += 1
+            stats['duration'] += duration
+            stats['queries'] += queries
+            stats['db_duration'] += db_duration
+            stats['serialize_duration'] += serialize_duration
+            stats['render_duration'] += render_duration
+            stats['response_bytes'] += response_bytes
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    stats['buckets'][index] += 1
+
+    def record_statements(self, statements):
+        """Копит время по отпечаткам SQL, храня только самые тяжёлые."""
+        limit = settings.REQUEST_METRICS_MAX_FINGERPRINTS
+        with self.lock:
+            for sql, duration in statements:
+                key = fingerprint(sql)
+                count, total = self.statements.get(key, (0, 0.0))
+                self.statements[key] = (count + 1, total + duration)
+            if len(self.statements) > limit:
+                heaviest = sorted(self.statements.items(),
+                                  key=lambda item: item[1][1],
+                                  reverse=True)[:limit]
+                self.statements = dict(heaviest)
+
+    def top_statements(self, count):
+        with self.lock:
+            return sorted(self.statements.items(),
+                          key=lambda item: item[1][1], reverse=True)[:count]
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus."""
+        with self.lock:
+            requests = {labels: dict(stats, buckets=list(stats['buckets']))
+                        for labels, stats in self.requests.items()}
+        lines = []
+        for name, key, kind, help_text in (
+            ('requests_total', 'count', 'counter', 'Число запросов.'),
+            ('request_duration_seconds_sum', 'duration', 'counter',
+             'Суммарное время обработки.'),
+            ('db_queries_total', 'queries', 'counter', 'Число SQL-запросов.'),
+            ('db_duration_seconds_sum', 'db_duration', 'counter',
+             'Суммарное время SQL-запросов.'),
+            ('serialize_duration_seconds_sum', 'serialize_duration',
+             'counter', 'Суммарное время сериализации данных ответа.'),
+            ('render_duration_seconds_sum', 'render_duration', 'counter',
+             'Суммарное время рендеринга ответа.'),
+            ('response_bytes_sum', 'response_bytes', 'counter',
+             'Суммарный размер ответов.'),
+        ):
+            lines.append(f'# HELP foodgram_{name} {help_text}')
+            lines.append(f'# TYPE foodgram_{name} {kind}')
+            for labels, stats in requests.items():
+                lines.append(f'foodgram_{name}{{{_labels(labels)}}} '
+                             f'{stats[key]}')
+
+        lines.append('# TYPE foodgram_request_duration_seconds_bucket '
+                     'counter')
+        for labels, stats in requests.items():
+            for bound, count in zip(DURATION_BUCKETS, stats['buckets']):
+                lines.append('foodgram_request_duration_seconds_bucket'
+                             f'{{{_labels(labels)},le="{bound}"}} {count}')
+            lines.append('foodgram_request_duration_seconds_bucket'
+                         f'{{{_labels(labels)},le="+Inf"}} {stats["count"]}')
+
+        statements = [
+            (sql.replace('\\', '\\\\').replace('"', '\\"'), stats)
+            for sql, stats in self.top_statements(
+                settings.REQUEST_METRICS_TOP_FINGERPRINTS)
+        ]
+        for name, index, help_text in (
+            ('sql_calls_total', 0, 'Число вызовов самых тяжёлых SQL.'),
+            ('sql_duration_seconds_sum', 1, 'Время самых тяжёлых SQL.'),
+        ):
+            lines.append(f'# HELP foodgram_{name} {help_text}')
+            lines.append(f'# TYPE foodgram_{name} counter')
+            for label, stats in statements:
+                lines.append(f'foodgram_{name}{{fingerprint="{label}"}} '
+                             f'{stats[index]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    view, method, status = labels
+    return f'view="{view}",method="{method}",status="{status}"'
+
+
+registry = MetricsRegistry()
+
+
+def metrics_view(request):
+    """Метрики текущего процесса для Prometheus."""
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,146 @@
+import logging
+import random
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import fingerprint, registry
+
+logger = logging.getLogger(__name__)
+
+
+class RequestRecorder:
+    """SQL и время этапов одного запроса.
+
+    Как обёртка выполнения SQL засекает время каждого запроса к базе.
+    Лежит в request.metrics, туда же вьюха и рендеринг пишут время
+    сериализации и рендеринга.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.serialize_duration = 0.0
+        self.render_duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append((sql, perf_counter() - started))
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.statements)
+
+
+@contextmanager
+def recording(recorder):
+    """Подключает recorder ко всем соединениям текущего потока.
+
+    Соединения у каждого потока свои, поэтому код запроса в другом
+    потоке (асинхронные вьюхи) подключает recorder заново.
+    """
+    with ExitStack() as stack:
+        if recorder is not None:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+        yield
+
+
+def time_serializer(serializer, request):
+    """Добавляет время to_representation сериализатора к метрикам."""
+    recorder = getattr(request, 'metrics', None)
+    if recorder is None:
+        return serializer
+    to_representation = serializer.to_representation
+
+    def timed_to_representation(instance):
+        started = perf_counter()
+        try:
+            return to_representation(instance)
+        finally:
+            recorder.serialize_duration += perf_counter() - started
+
+    serializer.to_representation = timed_to_representation
+    return serializer
+
+
+class RequestMetricsMiddleware:
+    """Считает по запросу SQL, время базы и сериализации, размер ответа.
+
+    Включается переменной окружения REQUEST_METRICS. Обрабатывается доля
+    запросов REQUEST_METRICS_SAMPLE_RATE: им добавляется заголовок
+    Server-Timing, а сводка копится для /metrics/. Запросы к базе дольше
+    REQUEST_METRICS_SLOW_QUERY_MS пишутся в лог. Потоковый ответ
+    учитывается, когда отдан целиком, и заголовка Server-Timing не
+    получает. Метрики у каждого процесса свои.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.REQUEST_METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+        recorder = request.metrics = RequestRecorder()
+        started = perf_counter()
+        with recording(recorder):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response, response.streaming_content, recorder,
+                started)
+            return response
+        duration = perf_counter() - started
+        self.record(request, response, recorder, duration,
+                    len(response.content))
+        response['Server-Timing'] = ', '.join((
+            f'db;desc="{len(recorder.statements)} queries";'
+            f'dur={recorder.duration * 1000:.1f}',
+            f'serialize;dur={recorder.serialize_duration * 1000:.1f}',
+            f'render;dur={recorder.render_duration * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+        return response
+
+    def process_template_response(self, request, response):
+        recorder = getattr(request, 'metrics', None)
+        if recorder is not None and not response.is_rendered:
+            started = perf_counter()
+
+            def rendered(response):
+                recorder.render_duration += perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def stream(self, request, response, content, recorder, started):
+        """Отдаёт потоковый ответ, считая его байты и запросы к базе."""
+        response_bytes = 0
+        try:
+            with recording(recorder):
+                for chunk in content:
+                    response_bytes += len(chunk)
+                    yield chunk
+        finally:
+            self.record(request, response, recorder,
+                        perf_counter() - started, response_bytes)
+
+    def record(self, request, response, recorder, duration, response_bytes):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        registry.record_request(
+            (view, request.method, response.status_code), duration,
+            len(recorder.statements), recorder.duration,
+            recorder.serialize_duration, recorder.render_duration,
+            response_bytes
+        )
+        registry.record_statements(recorder.statements)
+        threshold = settings.REQUEST_METRICS_SLOW_QUERY_MS / 1000
+        for sql, query_duration in recorder.statements:
+            if query_duration >= threshold:
+                logger.warning('Медленный запрос %.1f мс в %s: %s',
+                               query_duration * 1000, view, fingerprint(sql))
@@ -0,0 +1,54 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .cache import version_timestamp
+from .middleware import time_serializer
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы для справочников по версии в кеше.
+
+    Ответ помечается ETag и Last-Modified по токену версии из общего для
+    всех процессов кеша versions, поэтому при совпадении отдаётся 304 без
+    чтения справочника, а изменение в любом воркере меняет ETag во всех.
+    Cache-Control позволяет nginx кешировать ответ.
+    """
+    def get_version(self):
+        raise NotImplementedError(
+            '.get_version() must be implemented in the viewset.')
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        # Версия читается один раз на запрос, фильтры берут её из вьюхи.
+        version = self.version = self.get_version()
+        etag = '"{}"'.format(md5(
+            f'{version}:{request.accepted_media_type}'.encode()
+        ).hexdigest())
+        last_modified = version_timestamp(version)
+        response = get_conditional_response(request, etag=etag,
+                                            last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True,
+                            max_age=settings.REFERENCE_CACHE_MAX_AGE)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list,
+                                         *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve,
+                                         *args, **kwargs)
+
+
+class SerializerMetricsMixin:
+    """Засекает время сериализации ответа для метрик запроса."""
+
+    def get_serializer(self, *args, **kwargs):
+        return time_serializer(super().get_serializer(*args, **kwargs),
+                               self.request)
@@ -1,10 +1,88 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+def approximate_count(queryset):
+    """Оценка числа строк по плану запроса PostgreSQL.
+
+    На других базах возвращает точный COUNT(*).
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class ApproximateCountPaginator(DjangoPaginator):
+    """Пагинатор Django с оценочным количеством объектов."""
+
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list)
+
+
+class KeysetPagination(CursorPagination):
+    """Курсорная пагинация по убыванию первичного ключа."""
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = '-pk'
+    count = None
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data['count'] = self.count
+            response.data.move_to_end('count', last=False)
+        return response
 
 
 class CustomPaginations(PageNumberPagination):
-    """Пагинация для пользователей и рецептов."""
+    """Пагинация для пользователей и рецептов.
+
+    По умолчанию постраничная. С параметром pagination=cursor, параметром
+    cursor или заголовком X-Pagination: cursor переключается на курсорную
+    пагинацию без OFFSET и COUNT(*). Параметр count=approx заменяет
+    COUNT(*) оценкой планировщика, count=exact добавляет точное
+    количество в курсорный режим.
+    """
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_paginator = None
+
+    def use_cursor(self, request):
+        return ('cursor' in request.query_params
+                or request.query_params.get('pagination') == 'cursor'
+                or request.headers.get('X-Pagination') == 'cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count_mode = request.query_params.get('count')
+        if not self.use_cursor(request):
+            if count_mode == 'approx':
+                self.django_paginator_class = ApproximateCountPaginator
+            return super().paginate_queryset(queryset, request, view)
+
+        self.cursor_paginator = KeysetPagination()
+        self.display_page_controls = False
+        if count_mode == 'approx':
+            self.cursor_paginator.count = approximate_count(queryset)
+        elif count_mode == 'exact':
+            self.cursor_paginator.count = queryset.count()
+        return self.cursor_paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
 
 
 class RecipesInFollowPaginations(PageNumberPagination):
@@ -0,0 +1,65 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+
+
+class PayloadTooLargeError(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'payload_too_large'
+
+
+class LimitedStream:
+    """Поток тела запроса, который обрывает чтение сверх limit байт."""
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.consumed = 0
+
+    def read(self, size=-1):
+        # Читается на байт больше остатка: так превышение видно сразу,
+        # а не после чтения всего тела.
+        remaining = self.limit - self.consumed + 1
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        chunk = self.stream.read(size)
+        self.consumed += len(chunk)
+        if self.consumed > self.limit:
+            raise PayloadTooLargeError()
+        return chunk
+
+
+class UploadLimitMixin:
+    """Отклоняет тело больше RECIPE_UPLOAD_MAX_BYTES.
+
+    Content-Length проверяется до разбора, а прочитанные байты считаются
+    при разборе: тело без заголовка или в кусках (chunked) тоже не
+    читается сверх лимита.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get('request')
+        length = request.META.get('CONTENT_LENGTH') if request else None
+        if length and int(length) > settings.RECIPE_UPLOAD_MAX_BYTES:
+            raise PayloadTooLargeError()
+        return super().parse(
+            LimitedStream(stream, settings.RECIPE_UPLOAD_MAX_BYTES),
+            media_type, parser_context)
+
+
+class LimitedJSONParser(UploadLimitMixin, JSONParser):
+    pass
+
+
+class LimitedMultiPartParser(UploadLimitMixin, MultiPartParser):
+    pass
+
+
+class LimitedFormParser(UploadLimitMixin, FormParser):
+    pass
+
+
+UPLOAD_PARSERS = (LimitedJSONParser, LimitedMultiPartParser,
+                  LimitedFormParser)
@@ -0,0 +1,28 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class PlainTextRenderer(BaseRenderer):
+    """Рендерер для выгрузки списка покупок в TXT.
+
+    Сам файл отдаётся потоком из api.utils, рендерер нужен для выбора
+    формата и для ответов с ошибками.
+    """
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class CSVRenderer(PlainTextRenderer):
+    """Рендерер для выгрузки списка покупок в CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+SHOPPING_CART_RENDERERS = (PlainTextRenderer, CSVRenderer, JSONRenderer)
@@ -0,0 +1,67 @@
+from bisect import bisect_left
+from itertools import chain
+from threading import Lock
+
+from recipes.models import Ingredient
+
+from .cache import get_ingredients_version
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти воркера.
+
+    Названия хранятся отсортированными в casefold, поэтому поиск по началу
+    названия — это бинарный поиск, а не запрос к базе. Индекс
+    перестраивается, когда меняется версия справочника в общем кеше
+    versions, так что изменения из других процессов тоже подхватываются.
+    Версия, ключи и строки публикуются одним кортежем: читатель в другом
+    потоке не увидит новые ключи со старыми строками.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._index = (None, [], [])
+
+    def _refresh(self, version=None):
+        if version is None:
+            version = get_ingredients_version()
+        index = self._index
+        if version == index[0]:
+            return index
+        with self._lock:
+            if version == self._index[0]:
+                return self._index
+            rows = sorted(
+                (name.casefold(), pk, name, measurement_unit)
+                for pk, name, measurement_unit
+                in Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit').iterator()
+            )
+            self._index = (version, [row[0] for row in rows], rows)
+            return self._index
+
+    def search(self, query, limit=None, version=None):
+        """Ищет ингредиенты: сначала по началу названия, затем по вхождению.
+
+        version — уже прочитанная в запросе версия справочника, чтобы не
+        обращаться за ней к кешу второй раз.
+        """
+        _, keys, rows = self._refresh(version)
+        query = query.strip().casefold()
+        found = []
+        start = index = bisect_left(keys, query)
+        while (index < len(keys) and keys[index].startswith(query)
+               and len(found) != limit):
+            found.append(rows[index])
+            index += 1
+        if len(found) != limit:
+            for position in chain(range(start), range(index, len(rows))):
+                if query in keys[position]:
+                    found.append(rows[position])
+                    if len(found) == limit:
+                        break
+        return [Ingredient(id=pk, name=name, measurement_unit=unit)
+                for _, pk, name, unit in found]
+
+
+ingredient_index = IngredientIndex()
@@ -1,11 +1,15 @@
 from django.contrib.auth import get_user_model
 from django.db import transaction
-from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
 
 from recipes.models import (AmountIngredient, Favorite, Follow, Ingredient,
                             Recipe, ShoppingCart, Tag)
 
+from .cache import invalidate_recipe_shopping_carts
+from .fields import (RecipeImageField, RecipeImageSrcsetField,
+                     StreamingBase64ImageField)
+from .utils import delete_rows
+
 User = get_user_model()
 
 
@@ -47,6 +51,8 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request_user = self.context.get('request').user.id
         return Follow.objects.filter(following=obj.id,
                                      user=request_user).exists()
@@ -113,24 +119,39 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.SerializerMethodField()
     ingredients = AmountIngredientSerializer(many=True,
                                              source='amountingredient_set')
-    image = Base64ImageField()
+    image = RecipeImageField('card')
+    image_srcset = RecipeImageSrcsetField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image', 'image_srcset',
+                  'text', 'cooking_time')
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request_user = self.context.get('request').user.id
         return Favorite.objects.filter(recipe=obj.id,
                                        user=request_user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request_user = self.context.get('request').user.id
         return ShoppingCart.objects.filter(recipe=obj.id,
                                            user=request_user).exists()
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
+
+class RecipeDetailSerializer(RecipeSerializer):
+    """Сериализатор страницы рецепта с крупным вариантом картинки."""
+    image = RecipeImageField('full')
+
 
 class TagCreateInRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для выбора тэгов при создании рецепта."""
@@ -145,8 +166,7 @@ class TagCreateInRecipeSerializer(serializers.ModelSerializer):
 
 class IngredientCreateInRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для выбора ингредиентов при создании рецепта."""
-    id = serializers.PrimaryKeyRelatedField(source='ingredient',
-                                            queryset=Ingredient.objects.all())
+    id = serializers.IntegerField(source='ingredient', min_value=1)
     name = serializers.StringRelatedField(source='ingredient')
     measurement_unit = serializers.SlugRelatedField(
         source='ingredient',
@@ -162,9 +182,8 @@ class IngredientCreateInRecipeSerializer(serializers.ModelSerializer):
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания и редактирования рецептов."""
-    tags = serializers.PrimaryKeyRelatedField(many=True,
-                                              queryset=Tag.objects.all(),
-                                              required=True)
+    tags = serializers.ListField(child=serializers.IntegerField(min_value=1),
+                                 required=True)
     author = UserSerializer(read_only=True, required=False)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
@@ -173,7 +192,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         source='amountingredient_set',
         required=True
     )
-    image = Base64ImageField(required=True)
+    image = StreamingBase64ImageField(required=True)
 
     class Meta:
         model = Recipe
@@ -194,6 +213,50 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return ShoppingCart.objects.filter(recipe=obj.id,
                                            user=request_user).exists()
 
+    @staticmethod
+    def resolve_ids(model, ids, missing_message, duplicate_message):
+        """Находит объекты по id одним запросом.
+
+        Возвращает объекты в порядке id и список ошибок: про
+        отсутствующие и про повторяющиеся id сразу.
+        """
+        objects = model.objects.in_bulk(set(ids))
+        errors = []
+        missing = sorted({pk for pk in ids if pk not in objects})
+        if missing:
+            errors.append(missing_message.format(
+                ', '.join(map(str, missing))))
+        duplicates = sorted({pk for pk in ids if ids.count(pk) > 1})
+        if duplicates:
+            errors.append(duplicate_message.format(
+                ', '.join(map(str, duplicates))))
+        return [objects.get(pk) for pk in ids], errors
+
+    def validate(self, attrs):
+        errors = {}
+        ingredients = attrs.get('amountingredient_set')
+        if ingredients is not None:
+            objects, errors['ingredients'] = self.resolve_ids(
+                Ingredient, [item['ingredient'] for item in ingredients],
+                'Ингредиенты не найдены: {}.',
+                'Ингредиенты в рецепте не должны повторяться: {}.'
+            )
+            for item, ingredient in zip(ingredients, objects):
+                item['ingredient'] = ingredient
+        if 'tags' in attrs:
+            attrs['tags'], errors['tags'] = self.resolve_ids(
+                Tag, attrs['tags'],
+                'Теги не найдены: {}.',
+                'Теги не должны повторяться: {}.'
+            )
+        errors = {field: messages for field, messages in errors.items()
+                  if messages}
+        if errors:
+            raise serializers.ValidationError(errors)
+        if attrs.get('image') is not None:
+            attrs['image_digest'] = attrs['image'].digest
+        return attrs
+
     @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
@@ -213,56 +276,102 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         AmountIngredient.objects.bulk_create(amount_ing_create)
         return recipe
 
+    @staticmethod
+    def sync_ingredients(instance, ingredients):
+        """Приводит ингредиенты рецепта к переданным.
+
+        Меняются только отличающиеся строки: новые создаются, убранные
+        удаляются, у оставшихся обновляется количество. Возвращает True,
+        если что-то изменилось.
+        """
+        existing = {item.ingredient_id: item
+                    for item in instance.amountingredient_set.all()}
+        submitted = {item['ingredient'].pk: item['amount']
+                     for item in ingredients}
+        removed = [item.pk for ingredient_id, item in existing.items()
+                   if ingredient_id not in submitted]
+        changed = []
+        for ingredient_id, amount in submitted.items():
+            item = existing.get(ingredient_id)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        added = [AmountIngredient(recipe=instance,
+                                  ingredient_id=ingredient_id,
+                                  amount=amount)
+                 for ingredient_id, amount in submitted.items()
+                 if ingredient_id not in existing]
+
+        if removed:
+            delete_rows(AmountIngredient, id=removed)
+        if changed:
+            AmountIngredient.objects.bulk_update(changed, ['amount'])
+        if added:
+            AmountIngredient.objects.bulk_create(added)
+        return bool(removed or changed or added)
+
     @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('amountingredient_set', None)
         tags = validated_data.pop('tags', None)
-        if ingredients is not None:
-            instance.ingredients.clear()
-
-            ingredients_create = [
-                AmountIngredient(
-                    recipe=instance,
-                    ingredient=ingredient['ingredient'],
-                    amount=ingredient['amount']
-                )
-                for ingredient in ingredients
-            ]
-            AmountIngredient.objects.bulk_create(ingredients_create)
-
-        if tags is not None:
+        image = validated_data.get('image')
+        if ingredients is not None and self.sync_ingredients(instance,
+                                                             ingredients):
+            invalidate_recipe_shopping_carts(instance.pk)
+
+        if tags is not None and (
+            {tag.pk for tag in tags} != {tag.pk for tag in instance.tags.all()}
+        ):
             instance.tags.set(tags)
+        if image is not None and (
+            validated_data['image_digest'] == instance.image_digest
+        ):
+            del validated_data['image'], validated_data['image_digest']
         return super().update(instance, validated_data)
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # Временный файл очищенной картинки хранилище переносит,
+            # а не копирует, поэтому закрываем его явно.
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def to_representation(self, instance):
-        self.fields['tags'] = TagSerializer(many=True)
-        return super().to_representation(instance)
+        user = self.context.get('request').user
+        instance = Recipe.objects.with_related().with_user_flags(user).get(
+            pk=instance.pk)
+        return RecipeDetailSerializer(instance, context=self.context).data
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Сериализатор списка id рецептов для пакетных операций."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
 
 
 class RecipeFollowSerializer(serializers.ModelSerializer):
     """Сериализатор рецептов для подписок."""
+    image = RecipeImageField('thumb')
+    image_srcset = RecipeImageSrcsetField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time')
 
 
 class FollowSerializer(serializers.ModelSerializer):
     """Сериализатор подписок на пользователей."""
-    email = serializers.SlugRelatedField(source='following',
-                                         slug_field='email',
-                                         read_only=True)
-    id = serializers.SlugRelatedField(source='following',
-                                      slug_field='id',
-                                      read_only=True)
-    username = serializers.SlugRelatedField(source='following',
-                                            slug_field='username',
-                                            read_only=True)
-    first_name = serializers.SlugRelatedField(source='following',
-                                              slug_field='first_name',
-                                              read_only=True)
-    last_name = serializers.SlugRelatedField(source='following',
-                                             slug_field='last_name',
-                                             read_only=True)
+    email = serializers.ReadOnlyField(source='following.email')
+    id = serializers.ReadOnlyField(source='following.id')
+    username = serializers.ReadOnlyField(source='following.username')
+    first_name = serializers.ReadOnlyField(source='following.first_name')
+    last_name = serializers.ReadOnlyField(source='following.last_name')
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField(source='following.recipes')
     recipes_count = serializers.SerializerMethodField()
@@ -273,6 +382,10 @@ class FollowSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
 
     def get_recipes(self, obj):
+        if hasattr(obj.following, 'recipes_preview'):
+            return RecipeFollowSerializer(obj.following.recipes_preview,
+                                          many=True).data
+
         recipe = Recipe.objects.filter(author=obj.following).order_by('-id')
 
         if not self.context:
@@ -285,11 +398,13 @@ class FollowSerializer(serializers.ModelSerializer):
         return RecipeFollowSerializer(recipe, many=True).data
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(following=obj.following_id,
-                                     user=obj.user_id).exists()
+        # Сама запись подписки означает, что пользователь подписан.
+        return True
 
     def get_recipes_count(self, obj):
-        return len(Recipe.objects.filter(author=obj.following_id))
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
+        return Recipe.objects.filter(author=obj.following_id).count()
 
     def validate(self, attrs):
         if 'request' in self.context:
@@ -310,14 +425,15 @@ class FavoriteRecipeSerializer(serializers.ModelSerializer):
     name = serializers.SlugRelatedField(source='recipe',
                                         slug_field='name',
                                         read_only=True)
-    image = Base64ImageField(source='recipe.image', read_only=True)
+    image = RecipeImageField('thumb', source='recipe')
+    image_srcset = RecipeImageSrcsetField(source='recipe')
     cooking_time = serializers.SlugRelatedField(source='recipe',
                                                 slug_field='cooking_time',
                                                 read_only=True)
 
     class Meta:
         model = Favorite
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time')
 
 
 class ShoppingCartSerializer(FavoriteRecipeSerializer):
@@ -325,4 +441,4 @@ class ShoppingCartSerializer(FavoriteRecipeSerializer):
 
     class Meta:
         model = ShoppingCart
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time')
@@ -0,0 +1,120 @@
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (AmountIngredient, Favorite, Ingredient, Recipe,
+                            ShoppingCart, Tag)
+from recipes.signals import ingredients_loaded
+
+from .cache import (invalidate_authors, invalidate_ingredients,
+                    invalidate_recipe_shopping_carts, invalidate_recipes,
+                    invalidate_shopping_carts, invalidate_tags,
+                    invalidate_tokens)
+from .images import rendition_paths, schedule_recipe_image
+from .utils import close_unusable_connections
+
+User = get_user_model()
+
+
+COUNTER_FIELDS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'shopping_carts_count',
+}
+
+
+@receiver([post_save, post_delete], sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    invalidate_shopping_carts([instance.user_id])
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_link_created(sender, instance, created, **kwargs):
+    # Эндпоинты API пишут связи без сигналов и меняют счётчики сами,
+    # сюда попадают админка, shell и каскадные удаления.
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).change_counter(
+            COUNTER_FIELDS[sender], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_link_deleted(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).change_counter(
+        COUNTER_FIELDS[sender], -1)
+
+
+@receiver([post_save, post_delete], sender=AmountIngredient)
+def amount_ingredient_changed(sender, instance, **kwargs):
+    invalidate_recipe_shopping_carts(instance.recipe_id)
+    invalidate_recipes([instance.recipe_id])
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_recipes([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(sender, instance, **kwargs):
+    if instance.image and (
+        instance.image_renditions.get('source') != instance.image.name
+    ):
+        schedule_recipe_image(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    paths = rendition_paths(instance.image_renditions)
+    transaction.on_commit(lambda: list(map(default_storage.delete, paths)))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipes([instance.pk])
+    elif pk_set:
+        invalidate_recipes(pk_set)
+    else:
+        invalidate_tags()
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    invalidate_authors([instance.pk])
+    invalidate_tokens(Token.objects.filter(
+        user=instance).values_list('key', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Token)
+def token_changed(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver([post_save, post_delete, ingredients_loaded], sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    invalidate_ingredients()
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    invalidate_tags()
+
+
+@receiver(request_started)
+def check_database_connections(sender, **kwargs):
+    """Проверяет соединения перед запросом.
+
+    Истёкшие по CONN_MAX_AGE соединения к этому моменту уже закрыты
+    close_old_connections. Асинхронные вьюхи выполняются в пуле потоков
+    и проверяют свои соединения сами, см. async_views.
+    """
+    close_unusable_connections()
@@ -0,0 +1,270 @@
+import shutil
+import tempfile
+from base64 import b64encode
+from io import BytesIO
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (AmountIngredient, Favorite, Follow, Ingredient,
+                            Recipe, ShoppingCart, Tag)
+from users.models import User
+
+IMAGE = 'recipes/images/test.png'
+PREFIX = 'budget_'
+
+# Имя маршрута, адрес и допустимое число SQL-запросов. Бюджет один на оба
+# размера данных: запрос проходит, только если число запросов не растёт
+# вместе со страницей. Авторизация по токену стоит один запрос.
+QUERY_BUDGETS = (
+    ('recipes-list', '/api/recipes/?limit={size}', 5),
+    ('recipes-list favorited', '/api/recipes/?is_favorited=1&limit={size}',
+     5),
+    ('recipes-list in cart',
+     '/api/recipes/?is_in_shopping_cart=1&limit={size}', 5),
+    ('recipes-detail', '/api/recipes/{recipe}/', 4),
+    ('recipes-download-shopping-cart',
+     '/api/recipes/download_shopping_cart/', 2),
+    ('subscriptions', '/api/users/subscriptions/?limit={size}'
+     '&recipes_limit=3', 4),
+    ('users-list', '/api/users/?limit={size}', 3),
+    ('users-detail', '/api/users/{author}/', 2),
+    ('users-information-about-me', '/api/users/me/', 2),
+    ('Tags-list', '/api/tags/', 2),
+    ('ingredients-list', '/api/ingredients/', 2),
+)
+
+# Запросы, меняющие избранное и корзину: метод, адрес, передавать ли id
+# всех рецептов и бюджет. Выполняются по порядку, чтобы каждый
+# действительно менял строки: удаление, затем возврат. В бюджет входят
+# точки сохранения транзакции.
+WRITE_BUDGETS = (
+    ('recipes-recipe-to-favorite', 'delete',
+     '/api/recipes/{recipe}/favorite/', False, 5),
+    ('recipes-recipe-to-favorite', 'post',
+     '/api/recipes/{recipe}/favorite/', False, 6),
+    ('recipes-recipe-to-shopping-cart', 'delete',
+     '/api/recipes/{recipe}/shopping_cart/', False, 5),
+    ('recipes-recipe-to-shopping-cart', 'post',
+     '/api/recipes/{recipe}/shopping_cart/', False, 6),
+    ('recipes-favorite-bulk', 'delete', '/api/recipes/favorite/bulk/',
+     True, 6),
+    ('recipes-favorite-bulk', 'post', '/api/recipes/favorite/bulk/', True,
+     6),
+    ('recipes-shopping-cart-bulk', 'delete',
+     '/api/recipes/shopping_cart/bulk/', True, 6),
+    ('recipes-shopping-cart-bulk', 'post',
+     '/api/recipes/shopping_cart/bulk/', True, 6),
+    ('recipes-clear-shopping-cart', 'delete', '/api/recipes/shopping_cart/',
+     False, 5),
+)
+
+
+def jpeg_base64():
+    """Картинка JPEG с EXIF строкой data:image/jpeg;base64."""
+    image = Image.new('RGB', (8, 8), 'red')
+    exif = image.getexif()
+    exif[0x010F] = 'Camera'
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', exif=exif)
+    return f'data:image/jpeg;base64,{b64encode(buffer.getvalue()).decode()}'
+
+
+def create_recipe(author, ingredients, tags):
+    """Рецепт с готовыми вариантами картинки: обработка не ставится."""
+    recipe = Recipe.objects.create(
+        author=author, name='Рецепт', text='Текст', cooking_time=1,
+        image=IMAGE, image_renditions={'source': IMAGE})
+    recipe.tags.set(tags)
+    AmountIngredient.objects.bulk_create(
+        AmountIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+        for ingredient in ingredients)
+    return recipe
+
+
+class RecipeUpdateTest(TestCase):
+    """Редактирование рецепта меняет только изменившиеся строки."""
+
+    # Рецепт с тегами и ингредиентами, проверка id ингредиентов и тегов,
+    # точка сохранения и её снятие, одно обновление количества, корзины
+    # рецепта для сброса кеша, сохранение полей рецепта и рецепт для
+    # ответа (три запроса). Строки ингредиентов и теги не пересоздаются.
+    ONE_INGREDIENT_QUERIES = 13
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author',
+                                         email='author@example.com')
+        cls.tags = [Tag.objects.create(name=f'Тег {number}',
+                                       color=f'#00000{number}',
+                                       slug=f'tag-{number}')
+                    for number in range(2)]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(5)
+        ]
+        cls.recipe = create_recipe(cls.author, cls.ingredients, cls.tags)
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_one_ingredient_edit(self):
+        rows = dict(AmountIngredient.objects.filter(
+            recipe=self.recipe).values_list('ingredient_id', 'id'))
+        ingredients = [{'id': ingredient.pk, 'amount': 1}
+                       for ingredient in self.ingredients]
+        ingredients[0]['amount'] = 5
+        with self.assertNumQueries(self.ONE_INGREDIENT_QUERIES):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(
+                    f'/api/recipes/{self.recipe.pk}/',
+                    {'ingredients': ingredients,
+                     'tags': [tag.pk for tag in self.tags]},
+                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            dict(AmountIngredient.objects.filter(
+                recipe=self.recipe).values_list('ingredient_id', 'id')),
+            rows)
+        self.assertEqual(
+            AmountIngredient.objects.get(
+                recipe=self.recipe, ingredient=self.ingredients[0]).amount,
+            5)
+
+    def test_same_image_upload(self):
+        """Повторная загрузка той же картинки не перезаписывает файл."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        image = jpeg_base64()
+        url = f'/api/recipes/{self.recipe.pk}/'
+        with override_settings(MEDIA_ROOT=media_root):
+            self.client.patch(url, {'image': image}, format='json')
+            self.recipe.refresh_from_db()
+            name = self.recipe.image.name
+            response = self.client.patch(url, {'image': image},
+                                         format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertNotEqual(name, IMAGE)
+        self.assertEqual(self.recipe.image.name, name)
+
+
+def create_budget_data(size):
+    """Читатель, size авторов с рецептами, подписки, избранное и корзина.
+
+    В каждом рецепте size тегов и ингредиентов.
+    """
+    reader = User.objects.create(username=f'{PREFIX}reader',
+                                 email=f'{PREFIX}reader@example.com')
+    User.objects.bulk_create(
+        User(username=f'{PREFIX}{number}',
+             email=f'{PREFIX}{number}@example.com')
+        for number in range(size))
+    authors = list(User.objects.filter(username__startswith=PREFIX).exclude(
+        pk=reader.pk))
+    Tag.objects.bulk_create(
+        Tag(name=f'{PREFIX}{number}', color=f'#{number:06X}',
+            slug=f'{PREFIX}{number}')
+        for number in range(size))
+    tags = list(Tag.objects.filter(slug__startswith=PREFIX))
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'{PREFIX}{number}', measurement_unit='г')
+        for number in range(size))
+    ingredients = list(Ingredient.objects.filter(name__startswith=PREFIX))
+    Recipe.objects.bulk_create(
+        Recipe(author=author, name=f'{PREFIX}{author.pk}', text=PREFIX,
+               image=IMAGE, image_renditions={'source': IMAGE},
+               cooking_time=1)
+        for author in authors)
+    recipes = list(Recipe.objects.filter(author__in=authors))
+    AmountIngredient.objects.bulk_create(
+        AmountIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+        for recipe in recipes for ingredient in ingredients)
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe=recipe, tag=tag)
+        for recipe in recipes for tag in tags)
+    Follow.objects.bulk_create(Follow(user=reader, following=author)
+                               for author in authors)
+    Favorite.objects.bulk_create(Favorite(user=reader, recipe=recipe)
+                                 for recipe in recipes)
+    ShoppingCart.objects.bulk_create(ShoppingCart(user=reader, recipe=recipe)
+                                     for recipe in recipes)
+    return reader, authors[0], recipes[0]
+
+
+class QueryBudgetTest(TestCase):
+    """Эндпоинты API укладываются в бюджет SQL-запросов.
+
+    Кеши берутся из настроек, как в работе, и очищаются перед каждым
+    запросом, так что считаются запросы холодного кеша, в том числе к
+    кешу, если он хранится в базе.
+    """
+    size = 1
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.author, cls.recipe = create_budget_data(cls.size)
+        cls.token = Token.objects.create(user=cls.reader)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def request(self, method, url, data=None):
+        for cache in caches.all():
+            cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = getattr(self.client, method)(url, data,
+                                                        format='json')
+                b''.join(response)
+        return response, context.captured_queries
+
+    def get(self, url):
+        return self.request('get', url)
+
+    def assert_budget(self, response, queries, budget):
+        self.assertTrue(status.is_success(response.status_code),
+                        response.status_code)
+        self.assertLessEqual(len(queries), budget,
+                             '\n'.join(query['sql'] for query in queries))
+
+    def test_query_budgets(self):
+        for name, url, budget in QUERY_BUDGETS:
+            with self.subTest(name):
+                self.assert_budget(*self.get(url.format(
+                    size=self.size, recipe=self.recipe.pk,
+                    author=self.author.pk)), budget)
+
+    def test_write_query_budgets(self):
+        ids = list(Recipe.objects.filter(
+            author__username__startswith=PREFIX).values_list('id', flat=True))
+        for name, method, url, bulk, budget in WRITE_BUDGETS:
+            with self.subTest(f'{name} {method}'):
+                self.assert_budget(*self.request(
+                    method, url.format(recipe=self.recipe.pk),
+                    {'ids': ids} if bulk else None), budget)
+
+    def test_recipe_list_flags(self):
+        """Флаги избранного и корзины приходят аннотациями списка."""
+        response, _ = self.get(f'/api/recipes/?limit={self.size}')
+        self.assertEqual(len(response.data['results']), self.size)
+        for recipe in response.data['results']:
+            self.assertTrue(recipe['is_favorited'])
+            self.assertTrue(recipe['is_in_shopping_cart'])
+            self.assertTrue(recipe['author']['is_subscribed'])
+
+
+class LargePageQueryBudgetTest(QueryBudgetTest):
+    """Тот же бюджет на страницах из 50 объектов."""
+    size = 50
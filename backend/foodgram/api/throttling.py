@@ -0,0 +1,38 @@
+from collections.abc import Mapping
+from hashlib import sha256
+
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class SharedCacheThrottle(SimpleRateThrottle):
+    """Хранит историю запросов в общем для всех воркеров кеше throttle."""
+    cache = ConnectionProxy(caches, 'throttle')
+
+
+class LoginIPThrottle(SharedCacheThrottle):
+    """Ограничивает частоту попыток входа с одного адреса."""
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request),
+        }
+
+
+class LoginAccountThrottle(SharedCacheThrottle):
+    """Ограничивает частоту попыток входа в один аккаунт."""
+    scope = 'login_account'
+
+    def get_cache_key(self, request, view):
+        if not isinstance(request.data, Mapping):
+            return None
+        email = request.data.get('email')
+        if not isinstance(email, str) or not email.strip():
+            return None
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': sha256(email.strip().upper().encode()).hexdigest(),
+        }
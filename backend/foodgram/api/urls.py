@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .async_views import make_async
 from .views import (FollowViewSet, IngredientVievSet, RecipeViewSet,
                     TagViewSet, TokenCreateViewSet, UserViewSet)
 
@@ -10,9 +12,13 @@ router.register('tags', TagViewSet, basename='Tags')
 router.register('ingredients', IngredientVievSet, basename='ingredients')
 router.register('recipes', RecipeViewSet, basename='recipes')
 
+router_urls = router.urls
+if settings.SERVER_INTERFACE == 'asgi':
+    router_urls = make_async(router_urls)
+
 urlpatterns = [
     path('auth/token/login/', TokenCreateViewSet.as_view()),
     path('users/subscriptions/', FollowViewSet.as_view({'get': 'list'})),
-    path('', include(router.urls)),
+    path('', include(router_urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
@@ -1,15 +1,166 @@
-from django.http import HttpResponse
+import csv
+import json
+from hashlib import sha256
+from itertools import groupby
 
+from django.conf import settings
+from django.db import connections, router
+from django.http import StreamingHttpResponse
 
-def create_recipe_file(ingredients_in_shopping_cart):
-    text = []
-    for v in ingredients_in_shopping_cart:
-        text.append(
-            f"{v['ingredient__name']} - {v['amount']} "
-            f"{v['ingredient__measurement_unit']} ")
 
-    text = '\n'.join(text)
-    response = HttpResponse(text, content_type='text/plain')
-    response['Content-Disposition'] = ('attachment; '
-                                       'filename=shoping_cart.txt')
+class Echo:
+    """Псевдобуфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def _by_unit(ingredients):
+    return groupby(ingredients,
+                   key=lambda v: v['ingredient__measurement_unit'])
+
+
+def shopping_cart_txt(ingredients):
+    for index, (_, group) in enumerate(_by_unit(ingredients)):
+        if index:
+            yield '\n'
+        for v in group:
+            yield (f"{v['ingredient__name']} - {v['amount']} "
+                   f"{v['ingredient__measurement_unit']} \n")
+
+
+def shopping_cart_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for v in ingredients:
+        yield writer.writerow((v['ingredient__name'],
+                               v['amount'],
+                               v['ingredient__measurement_unit']))
+
+
+def shopping_cart_json(ingredients):
+    yield '['
+    for index, v in enumerate(ingredients):
+        item = json.dumps({'name': v['ingredient__name'],
+                           'amount': v['amount'],
+                           'measurement_unit': (
+                               v['ingredient__measurement_unit'])},
+                          ensure_ascii=False)
+        yield f',\n{item}' if index else f'\n{item}'
+    yield '\n]\n'
+
+
+SHOPPING_CART_EXPORTERS = {
+    'txt': (shopping_cart_txt, 'text/plain'),
+    'csv': (shopping_cart_csv, 'text/csv'),
+    'json': (shopping_cart_json, 'application/json'),
+}
+
+
+def create_recipe_file(ingredients_in_shopping_cart, file_format='txt'):
+    """Отдаёт список покупок потоком в выбранном формате.
+
+    Ожидает строки, отсортированные по единицам измерения и названию.
+    """
+    exporter, content_type = SHOPPING_CART_EXPORTERS[file_format]
+    response = StreamingHttpResponse(
+        exporter(ingredients_in_shopping_cart),
+        content_type=f'{content_type}; charset=utf-8'
+    )
+    response['Content-Disposition'] = (f'attachment; '
+                                       f'filename=shoping_cart.{file_format}')
     return response
+
+
+def insert_ignore(model, **values):
+    """Добавляет строку одним INSERT ... ON CONFLICT DO NOTHING.
+
+    Возвращает True, если строка добавлена, и False, если она уже была.
+    Сигналы модели не отправляются.
+    """
+    return bool(insert_rows(model, [values], model._meta.pk.name))
+
+
+def insert_rows(model, rows, returning):
+    """Добавляет строки одним INSERT ... ON CONFLICT DO NOTHING.
+
+    rows — словари с одинаковым набором полей. Возвращает значения поля
+    returning только у действительно добавленных строк, поэтому
+    параллельные вставки тех же строк не посчитаются дважды. Сигналы
+    модели не отправляются.
+    """
+    if not rows:
+        return []
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    names = list(rows[0])
+    fields = [model._meta.get_field(name) for name in names]
+    params = [field.get_db_prep_value(row[name], connection)
+              for row in rows for name, field in zip(names, fields)]
+    placeholders = f'({", ".join(["%s"] * len(fields))})'
+    sql = (f'INSERT INTO {quote(model._meta.db_table)} '
+           f'({", ".join(quote(field.column) for field in fields)}) '
+           f'VALUES {", ".join([placeholders] * len(rows))} '
+           f'ON CONFLICT DO NOTHING '
+           f'RETURNING {quote(model._meta.get_field(returning).column)}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def delete_rows(model, returning=None, **values):
+    """Удаляет строки одним DELETE.
+
+    Значение-список превращается в условие IN. Возвращает количество
+    удалённых строк, а с returning — список значений этого поля у
+    удалённых строк. Сигналы модели не отправляются.
+    """
+    if any(isinstance(value, (list, tuple, set)) and not value
+           for value in values.values()):
+        return [] if returning else 0
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    conditions, params = [], []
+    for name, value in values.items():
+        field = model._meta.get_field(name)
+        items = value if isinstance(value, (list, tuple, set)) else [value]
+        params.extend(field.get_db_prep_value(item, connection)
+                      for item in items)
+        conditions.append(
+            f'{quote(field.column)} IN ({", ".join(["%s"] * len(items))})'
+        )
+    sql = (f'DELETE FROM {quote(model._meta.db_table)} '
+           f'WHERE {" AND ".join(conditions)}')
+    if returning:
+        sql += f' RETURNING {quote(model._meta.get_field(returning).column)}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        if returning:
+            return [row[0] for row in cursor.fetchall()]
+        return cursor.rowcount
+
+
+def file_digest(file):
+    """SHA-256 содержимого файла в hex."""
+    digest = sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def close_unusable_connections():
+    """Закрывает постоянные соединения потока, которые база оборвала.
+
+    Замена CONN_HEALTH_CHECKS из Django 4.1: без проверки первый запрос
+    после перезапуска базы или PgBouncer упал бы с ошибкой соединения.
+    Соединения у каждого потока свои, поэтому проверка нужна в том
+    потоке, где выполняется вьюха.
+    """
+    if not settings.DB_CONN_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if (connection.connection is not None
+                and not connection.in_atomic_block
+                and not connection.is_usable()):
+            connection.close()
@@ -1,47 +1,66 @@
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import (BooleanField, Count, Exists, OuterRef, Prefetch,
+                              Sum, Value, prefetch_related_objects)
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.decorators import action
-from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
 from recipes.models import (AmountIngredient, Favorite, Follow, Ingredient,
-                            Recipe, ShoppingCart, Tag)
-
-from .filters import RecipeFilter
+                            Recipe, RecipeQuerySet, ShoppingCart, Tag)
+
+from .cache import (get_ingredients_version, get_recipe_data,
+                    get_shopping_cart, get_tags_version,
+                    invalidate_shopping_carts)
+from .fields import absolute_image_urls
+from .filters import IngredientSearchFilter, RecipeFilter
+from .mixins import ConditionalGetMixin, SerializerMetricsMixin
 from .pagination import CustomPaginations
+from .parsers import UPLOAD_PARSERS
 from .permissions import IsOwner
+from .renderers import SHOPPING_CART_RENDERERS
 from .serializers import (CustomTokenCreateSerializer,
                           FavoriteRecipeSerializer, FollowSerializer,
                           IngredientSerializer, RecipeCreateSerializer,
+                          RecipeDetailSerializer, RecipeIdsSerializer,
                           RecipeSerializer, ShoppingCartSerializer,
                           TagSerializer, User, UserRegistrationSerializer,
                           UserSerializer, UserSetPasswordSerializer)
-from .utils import create_recipe_file
+from .throttling import LoginAccountThrottle, LoginIPThrottle
+from .utils import create_recipe_file, delete_rows, insert_ignore, insert_rows
 
 
 class TokenCreateViewSet(ObtainAuthToken):
     """Вьюсет для создания токена."""
     serializer_class = CustomTokenCreateSerializer
+    throttle_classes = [LoginIPThrottle, LoginAccountThrottle]
 
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data,
                                            context={'request': request})
         serializer.is_valid(raise_exception=True)
-        user = get_object_or_404(User,
-                                 email=serializer.validated_data['email'],)
-        if user.check_password(serializer.validated_data['password']):
-            token, created = Token.objects.get_or_create(user=user)
-            return Response({
-                'auth_token': token.key,
-            })
+        user = User.objects.filter(
+            email__iexact=serializer.validated_data['email']
+        ).order_by('pk').first()
+        if user is None or not user.check_password(
+            serializer.validated_data['password']
+        ):
+            return Response(
+                {'Ошибка': ['Неверный email или пароль.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        token, created = Token.objects.get_or_create(user=user)
+        return Response({
+            'auth_token': token.key,
+        })
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(SerializerMetricsMixin, viewsets.ModelViewSet):
     """Вьюсет для пользователей."""
     queryset = User.objects.all()
     pagination_class = CustomPaginations
@@ -50,6 +69,14 @@ class UserViewSet(viewsets.ModelViewSet):
     ordering_fields = ['pk']
     ordering = ['pk']
 
+    def get_queryset(self):
+        user = self.request.user
+        if not user.is_authenticated:
+            return User.objects.annotate(
+                is_subscribed=Value(False, output_field=BooleanField()))
+        return User.objects.annotate(is_subscribed=Exists(
+            Follow.objects.filter(user=user, following=OuterRef('pk'))))
+
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return UserRegistrationSerializer
@@ -79,8 +106,7 @@ class UserViewSet(viewsets.ModelViewSet):
             url_path='me',
             permission_classes=[IsAuthenticated])
     def information_about_me(self, request):
-        username = self.request.user
-        user = get_object_or_404(User, username=username)
+        user = get_object_or_404(self.get_queryset(), pk=request.user.pk)
         if self.request.method == 'GET':
             serializer = self.get_serializer(user)
             return Response(serializer.data)
@@ -100,7 +126,7 @@ class UserViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             self.request.user.set_password(serializer.data["new_password"])
-            self.request.user.save()
+            self.request.user.save(update_fields=['password'])
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True,
@@ -108,79 +134,109 @@ class UserViewSet(viewsets.ModelViewSet):
             url_path='subscribe',
             permission_classes=[IsAuthenticated])
     def follow(self, request, *args, **kwargs):
-        serializer = FollowSerializer(data=request.data)
-        if serializer.is_valid(raise_exception=True):
-            following = get_object_or_404(
-                User,
-                id=self.kwargs.get('pk')
-            )
+        user = self.request.user
+        following_id = self.kwargs.get('pk')
 
-            if request.method == 'POST':
-                if self.request.user == following:
-                    return Response(
-                        {'Ошибка': ['Нельзя подписаться на самого себя!']},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                elif Follow.objects.filter(user=self.request.user,
-                                           following=following).exists():
-                    return Response(
-                        {'Ошибка': ['Вы уже подписаны на пользователя!']},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                serializer.save(user=self.request.user, following=following)
-                return Response(serializer.data)
-
-            elif request.method == 'DELETE':
-                if Follow.objects.filter(user=self.request.user,
-                                         following=following).exists():
-                    follow = get_object_or_404(
-                        Follow,
-                        user=self.request.user,
-                        following=self.get_object()
-                    )
-                    follow.delete()
-                    return Response(status=status.HTTP_204_NO_CONTENT)
+        if request.method == 'POST':
+            if str(user.id) == following_id:
                 return Response(
-                    {'Ошибка': ([f'Вы не подписаны на пользователя '
-                                f'{following.username}!'])},
+                    {'Ошибка': ['Нельзя подписаться на самого себя!']},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            following = get_object_or_404(User, id=following_id)
+            if not insert_ignore(Follow, user_id=user.id,
+                                 following_id=following.id):
+                return Response(
+                    {'Ошибка': ['Вы уже подписаны на пользователя!']},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            serializer = FollowSerializer(Follow(user=user,
+                                                 following=following))
+            return Response(serializer.data)
+
+        if delete_rows(Follow, user_id=user.id, following_id=following_id):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        following = get_object_or_404(User, id=following_id)
+        return Response(
+            {'Ошибка': ([f'Вы не подписаны на пользователя '
+                        f'{following.username}!'])},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ConditionalGetMixin, SerializerMetricsMixin,
+                 viewsets.ReadOnlyModelViewSet):
     """Вьюсет для тегов."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
 
+    def get_version(self):
+        return get_tags_version()
 
-class IngredientVievSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientVievSet(ConditionalGetMixin, SerializerMetricsMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """Вьюсет для ингредиентов."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [AllowAny]
-    filter_backends = (SearchFilter,)
-    search_fields = ('^name',)
+    filter_backends = (IngredientSearchFilter,)
+
+    def get_version(self):
+        return get_ingredients_version()
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(SerializerMetricsMixin, viewsets.ModelViewSet):
     """Вьюсет для рецептов."""
     queryset = Recipe.objects.all()
     pagination_class = CustomPaginations
     http_method_names = ['get', 'post', 'patch', 'delete']
+    parser_classes = UPLOAD_PARSERS
     filter_backends = (DjangoFilterBackend, OrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('pk', 'id', 'name', 'cooking_time',
+                       'favorites_count', 'shopping_carts_count')
     ordering = ['-pk']
 
+    def get_queryset(self):
+        if self.action == 'retrieve':
+            return Recipe.objects.select_related('author').with_user_flags(
+                self.request.user)
+        return Recipe.objects.with_related().with_user_flags(
+            self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+
+        def build():
+            prefetch_related_objects([recipe],
+                                     *RecipeQuerySet.related_lookups())
+            # Без запроса в контексте ссылки на картинки относительные:
+            # кеш общий для запросов с разными Host.
+            context = self.get_serializer_context()
+            context['request'] = None
+            return self.get_serializer(recipe, context=context).data
+
+        data = absolute_image_urls(get_recipe_data(recipe, build), request)
+        data['is_favorited'] = recipe.is_favorited
+        data['is_in_shopping_cart'] = recipe.is_in_shopping_cart
+        data['author']['is_subscribed'] = recipe.author_is_subscribed
+        return Response(data)
+
     def get_serializer_class(self):
         if self.request.method in ('POST', 'PATCH'):
             return RecipeCreateSerializer
+        if self.action == 'retrieve':
+            return RecipeDetailSerializer
         return RecipeSerializer
 
     def get_permissions(self):
         if self.action in ('recipe_to_favorite',
                            'recipe_to_shopping_cart',
+                           'favorite_bulk',
+                           'shopping_cart_bulk',
+                           'clear_shopping_cart',
                            'download_shopping_cart'):
             return [IsAuthenticated(), IsOwner()]
         elif self.request.method in SAFE_METHODS:
@@ -190,92 +246,165 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return super().get_permissions()
 
     @action(detail=True, methods=['post', 'delete'], url_path='favorite')
+    @transaction.atomic
     def recipe_to_favorite(self, request, *args, **kwargs):
-        serializer = FavoriteRecipeSerializer(data=request.data)
-        if serializer.is_valid(raise_exception=True):
-            recipe = get_object_or_404(
-                Recipe,
-                id=self.kwargs.get('pk')
-            )
+        user = self.request.user
+        recipe_id = self.kwargs.get('pk')
 
-            if request.method == 'POST':
-                if Favorite.objects.filter(user=self.request.user,
-                                           recipe=recipe).exists():
-                    return Response(
-                        {'Ошибка': ['Рецепт уже добавлен в избранное!']},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                serializer.save(user=self.request.user, recipe=recipe)
-                return Response(serializer.data, status=status.HTTP_200_OK)
-
-            elif request.method == 'DELETE':
-                if Favorite.objects.filter(user=self.request.user,
-                                           recipe=recipe).exists():
-                    recipe_in_favorite = Favorite.objects.get(
-                        user=self.request.user,
-                        recipe=recipe
-                    )
-                    recipe_in_favorite.delete()
-                    return Response(status=status.HTTP_204_NO_CONTENT)
+        if request.method == 'POST':
+            recipe = get_object_or_404(Recipe, id=recipe_id)
+            if not insert_ignore(Favorite, user_id=user.id,
+                                 recipe_id=recipe.id):
                 return Response(
-                    {'Ошибка': [f'Рецепт {recipe.name} '
-                     f'отсутствует в списке избранных!']},
+                    {'Ошибка': ['Рецепт уже добавлен в избранное!']},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            Recipe.objects.filter(pk=recipe.pk).change_counter(
+                'favorites_count', 1)
+            serializer = FavoriteRecipeSerializer(Favorite(user=user,
+                                                           recipe=recipe))
+            return Response(serializer.data, status=status.HTTP_200_OK)
+
+        if delete_rows(Favorite, user_id=user.id, recipe_id=recipe_id):
+            Recipe.objects.filter(pk=recipe_id).change_counter(
+                'favorites_count', -1)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        recipe = get_object_or_404(Recipe, id=recipe_id)
+        return Response(
+            {'Ошибка': [f'Рецепт {recipe.name} '
+             f'отсутствует в списке избранных!']},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
     @action(detail=True, methods=['post', 'delete'], url_path='shopping_cart')
+    @transaction.atomic
     def recipe_to_shopping_cart(self, request, *args, **kwargs):
-        serializer = ShoppingCartSerializer(data=request.data)
         user = self.request.user
-        if serializer.is_valid(raise_exception=True):
-            recipe = get_object_or_404(
-                Recipe,
-                id=self.kwargs.get('pk')
-            )
+        recipe_id = self.kwargs.get('pk')
 
-            if request.method == 'POST':
-                if ShoppingCart.objects.filter(recipe=recipe,
-                                               user=user).exists():
-                    return Response(
-                        {'Ошибка': ['Рецепт уже добавлен в корзину!']},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                serializer.save(user=user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-
-            if request.method == 'DELETE':
-                if ShoppingCart.objects.filter(recipe=recipe,
-                                               user=user).exists():
-                    recipe_in_shopping_cart = ShoppingCart.objects.get(
-                        recipe=recipe,
-                        user=user
-                    )
-                    recipe_in_shopping_cart.delete()
-                    return Response(status=status.HTTP_204_NO_CONTENT)
+        if request.method == 'POST':
+            recipe = get_object_or_404(Recipe, id=recipe_id)
+            if not insert_ignore(ShoppingCart, user_id=user.id,
+                                 recipe_id=recipe.id):
                 return Response(
-                    {'Ошибка': [f'Рецепт {recipe.name} '
-                     f'отсутствует в корзине!']},
-                    status=status.HTTP_400_BAD_REQUEST)
+                    {'Ошибка': ['Рецепт уже добавлен в корзину!']},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            Recipe.objects.filter(pk=recipe.pk).change_counter(
+                'shopping_carts_count', 1)
+            invalidate_shopping_carts([user.id])
+            serializer = ShoppingCartSerializer(ShoppingCart(user=user,
+                                                             recipe=recipe))
+            return Response(serializer.data,
+                            status=status.HTTP_201_CREATED)
 
-    @action(detail=False, methods=['get'], url_path='download_shopping_cart')
+        if delete_rows(ShoppingCart, user_id=user.id, recipe_id=recipe_id):
+            Recipe.objects.filter(pk=recipe_id).change_counter(
+                'shopping_carts_count', -1)
+            invalidate_shopping_carts([user.id])
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        recipe = get_object_or_404(Recipe, id=recipe_id)
+        return Response(
+            {'Ошибка': [f'Рецепт {recipe.name} '
+             f'отсутствует в корзине!']},
+            status=status.HTTP_400_BAD_REQUEST)
+
+    def bulk_toggle(self, request, model, counter):
+        """Пакетно добавляет или удаляет рецепты из избранного или корзины.
+
+        Возвращает статус для каждого переданного id.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        user = self.request.user
+        found = set(Recipe.objects.filter(id__in=ids).values_list(
+            'id', flat=True))
+
+        if request.method == 'POST':
+            changed = set(insert_rows(
+                model,
+                [{'user_id': user.id, 'recipe_id': recipe_id}
+                 for recipe_id in found],
+                returning='recipe_id'
+            ))
+            statuses = ('added', 'exists')
+            delta = 1
+        else:
+            changed = set(delete_rows(model, returning='recipe_id',
+                                      user_id=user.id,
+                                      recipe_id=list(found)))
+            statuses = ('removed', 'absent')
+            delta = -1
+
+        Recipe.objects.filter(pk__in=changed).change_counter(counter, delta)
+        results = [
+            {'id': recipe_id,
+             'status': ('not_found' if recipe_id not in found
+                        else statuses[recipe_id not in changed])}
+            for recipe_id in ids
+        ]
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='favorite/bulk')
+    @transaction.atomic
+    def favorite_bulk(self, request, *args, **kwargs):
+        return self.bulk_toggle(request, Favorite, 'favorites_count')
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart/bulk')
+    @transaction.atomic
+    def shopping_cart_bulk(self, request, *args, **kwargs):
+        response = self.bulk_toggle(request, ShoppingCart,
+                                    'shopping_carts_count')
+        invalidate_shopping_carts([self.request.user.id])
+        return response
+
+    @action(detail=False, methods=['delete'], url_path='shopping_cart')
+    @transaction.atomic
+    def clear_shopping_cart(self, request, *args, **kwargs):
+        removed = delete_rows(ShoppingCart, returning='recipe_id',
+                              user_id=self.request.user.id)
+        Recipe.objects.filter(pk__in=removed).change_counter(
+            'shopping_carts_count', -1)
+        invalidate_shopping_carts([self.request.user.id])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['get'], url_path='download_shopping_cart',
+            renderer_classes=SHOPPING_CART_RENDERERS)
     def download_shopping_cart(self, request, *args, **kwargs):
         ingredients_in_shopping_cart = AmountIngredient.objects.filter(
             recipe__shopping_carts__user=self.request.user).values(
             'ingredient__name', 'ingredient__measurement_unit').annotate(
-                amount=Sum('amount'))
-        return create_recipe_file(ingredients_in_shopping_cart)
+                amount=Sum('amount')).order_by(
+                    'ingredient__measurement_unit', 'ingredient__name')
+        return create_recipe_file(
+            get_shopping_cart(request.user.id, ingredients_in_shopping_cart),
+            request.accepted_renderer.format
+        )
 
 
-class FollowViewSet(viewsets.ReadOnlyModelViewSet):
+class FollowViewSet(SerializerMetricsMixin,
+                    viewsets.ReadOnlyModelViewSet):
     """Вьюсет для подписок."""
     serializer_class = FollowSerializer
     pagination_class = CustomPaginations
 
     def get_queryset(self):
-        req = self.request
-        queryset = Follow.objects.filter(user=req.user)
-        return queryset
+        recipes = Recipe.objects.order_by('-id')
+        limit = self.request.query_params.get('recipes_limit', '')
+        if limit.isdigit():
+            recipes = recipes.filter(author__in=Follow.objects.filter(
+                user=self.request.user).values('following')
+            ).latest_per_author(int(limit))
+        return Follow.objects.filter(user=self.request.user).select_related(
+            'following').annotate(
+                recipes_count=Count('following__recipes')
+        ).prefetch_related(
+            Prefetch('following__recipes', queryset=recipes,
+                     to_attr='recipes_preview')
+        ).order_by('-pk')
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -48,8 +48,25 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+REQUEST_METRICS = os.getenv('REQUEST_METRICS', 'false').lower() == 'true'
+
+if REQUEST_METRICS:
+    MIDDLEWARE.insert(0, 'api.middleware.RequestMetricsMiddleware')
+
+REQUEST_METRICS_SAMPLE_RATE = float(
+    os.getenv('REQUEST_METRICS_SAMPLE_RATE', 1.0))
+
+REQUEST_METRICS_SLOW_QUERY_MS = float(
+    os.getenv('REQUEST_METRICS_SLOW_QUERY_MS', 100))
+
+REQUEST_METRICS_MAX_FINGERPRINTS = 500
+
+REQUEST_METRICS_TOP_FINGERPRINTS = 20
+
 ROOT_URLCONF = 'foodgram.urls'
 
+SERVER_INTERFACE = os.getenv('SERVER_INTERFACE', 'wsgi')
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -79,14 +96,103 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'postgres'),
         'HOST': os.getenv('DB_HOST', 'localhost'),
-        'PORT': os.getenv('DB_PORT', '5432')
+        'PORT': os.getenv('DB_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+            'DB_DISABLE_SERVER_SIDE_CURSORS', 'false').lower() == 'true',
     }
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['default']['OPTIONS'] = {
+        'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+    }
+    DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 30000))
+    if DB_STATEMENT_TIMEOUT:
+        DATABASES['default']['OPTIONS']['options'] = (
+            f'-c statement_timeout={DB_STATEMENT_TIMEOUT}')
+
+DB_CONN_HEALTH_CHECKS = os.getenv(
+    'DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true'
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# Общий для всех процессов кеш: memcached, если задан его адрес (в
+# docker-compose он есть), иначе LocMem, которого хватает одному процессу
+# при разработке и в тестах.
+MEMCACHED_LOCATION = os.getenv('MEMCACHED_LOCATION', '')
+
+if MEMCACHED_LOCATION:
+    SHARED_CACHE_BACKEND = 'django.core.cache.backends.memcached.PyMemcacheCache'
+    SHARED_CACHE_LOCATION = MEMCACHED_LOCATION
+    SHARED_CACHE_OPTIONS = {}
+else:
+    SHARED_CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+    SHARED_CACHE_LOCATION = 'foodgram-shared'
+    SHARED_CACHE_OPTIONS = {'MAX_ENTRIES': 100000}
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    },
+    'recipes': {
+        'BACKEND': os.getenv('RECIPE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('RECIPE_CACHE_LOCATION', 'foodgram-recipes'),
+        'TIMEOUT': int(os.getenv('RECIPE_CACHE_TIMEOUT', 24 * 60 * 60)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('RECIPE_CACHE_MAX_ENTRIES', 5000)),
+        },
+    },
+    # Токены версий должны быть общими для всех процессов: по ним
+    # сбрасываются локальные кеши, ETag и индекс ингредиентов.
+    'versions': {
+        'BACKEND': os.getenv('VERSIONS_CACHE_BACKEND', SHARED_CACHE_BACKEND),
+        'LOCATION': os.getenv('VERSIONS_CACHE_LOCATION', SHARED_CACHE_LOCATION),
+        'TIMEOUT': None,
+        'KEY_PREFIX': 'versions',
+        'OPTIONS': SHARED_CACHE_OPTIONS,
+    },
+    # Счётчики попыток входа: в кеше воркера лимит умножился бы на число
+    # воркеров.
+    'throttle': {
+        'BACKEND': os.getenv('THROTTLE_CACHE_BACKEND', SHARED_CACHE_BACKEND),
+        'LOCATION': os.getenv('THROTTLE_CACHE_LOCATION', SHARED_CACHE_LOCATION),
+        'KEY_PREFIX': 'throttle',
+        'OPTIONS': SHARED_CACHE_OPTIONS,
+    },
+    # LocMem у каждого воркера свой, и выход или блокировка сбрасывают
+    # запись только в одном из них, поэтому время жизни по умолчанию
+    # короткое. С общим бэкендом (Redis, Memcached) его можно увеличить.
+    'auth': {
+        'BACKEND': os.getenv('AUTH_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('AUTH_CACHE_LOCATION', 'foodgram-auth'),
+        'TIMEOUT': int(os.getenv('AUTH_CACHE_TIMEOUT', 5)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('AUTH_CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+}
+
+SHOPPING_CART_CACHE_TIMEOUT = int(os.getenv('SHOPPING_CART_CACHE_TIMEOUT', 60 * 60))
+
+REFERENCE_CACHE_MAX_AGE = int(os.getenv('REFERENCE_CACHE_MAX_AGE', 60))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
+PASSWORD_HASHERS = [
+    'users.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+PASSWORD_HASH_ITERATIONS = int(os.getenv('PASSWORD_HASH_ITERATIONS', 260000))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -107,16 +213,24 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
 
-    'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
-    ],
+    'DEFAULT_AUTHENTICATION_CLASSES': os.getenv(
+        'API_AUTHENTICATION_CLASSES',
+        'api.authentication.CachedTokenAuthentication,'
+        'rest_framework.authentication.BasicAuthentication,'
+        'rest_framework.authentication.SessionAuthentication'
+    ).split(','),
 
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
 
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': os.getenv('LOGIN_IP_THROTTLE_RATE', '30/min'),
+        'login_account': os.getenv('LOGIN_ACCOUNT_THROTTLE_RATE', '10/min'),
+    },
+
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 1)),
+
     'SEARCH_PARAM': 'name'
 }
 
@@ -146,6 +260,22 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMAGE_RENDITIONS = {
+    'thumb': int(os.getenv('RECIPE_IMAGE_THUMB_SIZE', 160)),
+    'card': int(os.getenv('RECIPE_IMAGE_CARD_SIZE', 480)),
+    'full': int(os.getenv('RECIPE_IMAGE_FULL_SIZE', 1280)),
+}
+
+RECIPE_IMAGE_QUALITY = int(os.getenv('RECIPE_IMAGE_QUALITY', 80))
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+RECIPE_IMAGE_MAX_BYTES = int(os.getenv('RECIPE_IMAGE_MAX_BYTES', 5 * 1024 * 1024))
+
+RECIPE_IMAGE_MAX_PIXELS = int(os.getenv('RECIPE_IMAGE_MAX_PIXELS', 25_000_000))
+
+RECIPE_UPLOAD_MAX_BYTES = RECIPE_IMAGE_MAX_BYTES * 4 // 3 + 256 * 1024
+
 
 AUTH_USER_MODEL = 'users.User'
 
@@ -0,0 +1,7 @@
+import os
+
+bind = '0.0.0.0:8000'
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+
+if os.getenv('SERVER_INTERFACE', 'wsgi') == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
@@ -47,7 +47,7 @@ class RecipeAdmin(admin.ModelAdmin):
         'get_ingredients',
         'get_tags',
         'cooking_time',
-        'get_count_add_to_favorite'
+        'favorites_count'
     )
     search_fields = ('name',)
     list_filter = ('name', 'author', 'tags')
@@ -61,10 +61,6 @@ class RecipeAdmin(admin.ModelAdmin):
         return '\n'.join([t.name + ',' for t in obj.tags.all()])
     get_tags.short_description = 'Теги'
 
-    def get_count_add_to_favorite(self, obj):
-        return len(Favorite.objects.filter(recipe=obj))
-    get_count_add_to_favorite.short_description = 'Кол-во в избранном'
-
 
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
@@ -0,0 +1,139 @@
+import csv
+import json
+import os
+from itertools import islice
+from tempfile import SpooledTemporaryFile
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.models import Ingredient
+from recipes.signals import ingredients_loaded
+
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if len(row) >= 2:
+                yield row[0], row[1]
+
+
+def read_json(path):
+    """Читает массив JSON целиком, а JSON Lines (.jsonl) — построчно."""
+    with open(path, encoding='utf-8') as file:
+        if path.endswith('.jsonl'):
+            items = (json.loads(line) for line in file if line.strip())
+        else:
+            items = json.load(file)
+        for item in items:
+            yield item['name'], item['measurement_unit']
+
+
+def synthetic(count):
+    for number in range(count):
+        yield f'ингредиент {number}', UNITS[number % len(UNITS)]
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV (название,единица) или JSON. '
+            'Пары (название, единица), которые уже есть в базе или '
+            'повторяются в файле, пропускаются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?',
+                            default=os.path.join('data', 'ingredients.csv'))
+        parser.add_argument('--format', choices=('csv', 'json'),
+                            help='Формат файла, по умолчанию по расширению.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать, что будет добавлено.')
+        parser.add_argument('--copy', action='store_true',
+                            help='Загрузить через COPY во временную таблицу '
+                                 '(только PostgreSQL).')
+        parser.add_argument('--synthetic', type=int, metavar='N',
+                            help='Замер: загрузить N синтетических строк и '
+                                 'откатить транзакцию.')
+
+    def rows(self, options):
+        if options['synthetic']:
+            return synthetic(options['synthetic'])
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден.')
+        file_format = options['format'] or (
+            'json' if path.endswith(('.json', '.jsonl')) else 'csv')
+        return read_csv(path) if file_format == 'csv' else read_json(path)
+
+    def unique_rows(self, rows, seen):
+        for name, unit in rows:
+            key = (name.strip(), unit.strip())
+            if key[0] and key not in seen:
+                seen.add(key)
+                yield key
+
+    def handle(self, *args, **options):
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy работает только с PostgreSQL.')
+        started = perf_counter()
+        with transaction.atomic():
+            added = self.load(options)
+            if options['dry_run'] or options['synthetic']:
+                transaction.set_rollback(True)
+            elif added:
+                ingredients_loaded.send(sender=Ingredient)
+        elapsed = perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено ингредиентов: {added} за {elapsed:.2f} с '
+            f'({added / elapsed:.0f} строк/с).'))
+        if options['dry_run'] or options['synthetic']:
+            self.stdout.write('Изменения не сохранены.')
+
+    def load(self, options):
+        seen = set(Ingredient.objects.values_list(
+            'name', 'measurement_unit').iterator())
+        existing = len(seen)
+        rows = self.unique_rows(self.rows(options), seen)
+        if options['copy'] and not options['dry_run']:
+            return self.copy(rows)
+        added = 0
+        for batch in chunked(rows, options['batch_size']):
+            if not options['dry_run']:
+                Ingredient.objects.bulk_create(
+                    Ingredient(name=name, measurement_unit=unit)
+                    for name, unit in batch)
+            added += len(batch)
+            self.stdout.write(f'Добавлено: {added}, уже было: {existing}')
+        return added
+
+    def copy(self, rows):
+        """Загружает строки через COPY и переносит новые одним INSERT."""
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with SpooledTemporaryFile(max_size=16 * 1024 * 1024,
+                                  mode='w+', encoding='utf-8',
+                                  newline='') as buffer:
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'CREATE TEMPORARY TABLE ingredient_staging '
+                    '(name varchar(200), measurement_unit varchar(200)) '
+                    'ON COMMIT DROP')
+                cursor.cursor.copy_expert(
+                    'COPY ingredient_staging FROM STDIN WITH (FORMAT csv)',
+                    buffer)
+                cursor.execute(
+                    f'INSERT INTO {table} (name, measurement_unit) '
+                    'SELECT name, measurement_unit FROM ingredient_staging')
+                return cursor.rowcount
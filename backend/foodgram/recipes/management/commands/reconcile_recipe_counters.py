@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+
+def count_rows(model):
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+            'recipe').annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики избранного и корзин у рецептов с таблицами '
+            'Favorite и ShoppingCart и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать расхождения.')
+
+    def handle(self, *args, **options):
+        drifted = Recipe.objects.annotate(
+            actual_favorites=count_rows(Favorite),
+            actual_shopping_carts=count_rows(ShoppingCart),
+        ).filter(
+            ~Q(favorites_count=F('actual_favorites'))
+            | ~Q(shopping_carts_count=F('actual_shopping_carts'))
+        )
+        drifted_ids = list(drifted.values_list('pk', flat=True))
+        self.stdout.write(f'Рецептов с расхождениями: {len(drifted_ids)}')
+        if options['dry_run'] or not drifted_ids:
+            return
+        Recipe.objects.filter(pk__in=drifted_ids).update(
+            favorites_count=count_rows(Favorite),
+            shopping_carts_count=count_rows(ShoppingCart),
+        )
+        self.stdout.write(self.style.SUCCESS('Счётчики исправлены.'))
@@ -0,0 +1,81 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:01
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def duplicates(model, fields, **aggregates):
+    return model.objects.values(*fields).annotate(
+        keep_id=Min('pk'), total=Count('pk'), **aggregates
+    ).filter(total__gt=1).order_by()
+
+
+def count_rows(model):
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+            'recipe').annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def remove_duplicates(apps, schema_editor):
+    """Удаляет дубли перед созданием уникальных ограничений.
+
+    У дублей ингредиентов в рецепте количество складывается в
+    оставшуюся запись.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    AmountIngredient = apps.get_model('recipes', 'AmountIngredient')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Follow = apps.get_model('recipes', 'Follow')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+
+    for model, fields in ((Favorite, ('user', 'recipe')),
+                          (ShoppingCart, ('user', 'recipe')),
+                          (Follow, ('user', 'following'))):
+        for row in duplicates(model, fields):
+            model.objects.filter(
+                **{field: row[field] for field in fields}
+            ).exclude(pk=row['keep_id']).delete()
+
+    for row in duplicates(AmountIngredient, ('recipe', 'ingredient'),
+                          amount_total=Sum('amount')):
+        AmountIngredient.objects.filter(pk=row['keep_id']).update(
+            amount=row['amount_total'])
+        AmountIngredient.objects.filter(
+            recipe=row['recipe'], ingredient=row['ingredient']
+        ).exclude(pk=row['keep_id']).delete()
+
+    Recipe.objects.update(favorites_count=count_rows(Favorite),
+                          shopping_carts_count=count_rows(ShoppingCart))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='amountingredient',
+            index=models.Index(fields=['recipe', 'ingredient', 'amount'], name='amount_ingredient_cover_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='amountingredient',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredient'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'following'), name='unique_follow'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
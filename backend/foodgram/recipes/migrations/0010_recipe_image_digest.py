@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_author_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_digest',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='SHA-256 загруженной картинки'),
+        ),
+    ]
@@ -1,6 +1,10 @@
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch,
+                              Value, Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest, RowNumber
 
 User = get_user_model()
 
@@ -32,6 +36,65 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Кверисет рецептов."""
+
+    @staticmethod
+    def related_lookups():
+        """Связи рецепта, которые нужны для его представления."""
+        return (
+            Prefetch('tags'),
+            Prefetch('amountingredient_set',
+                     queryset=AmountIngredient.objects.select_related(
+                         'ingredient')),
+        )
+
+    def with_related(self):
+        """Подгружает автора, теги и ингредиенты рецептов."""
+        return self.select_related('author').prefetch_related(
+            *self.related_lookups())
+
+    def change_counter(self, field, delta):
+        """Атомарно изменяет счётчик у рецептов кверисета на delta.
+
+        Счётчик не опускается ниже нуля: если он уже разошёлся с
+        таблицей, удаление связи не должно падать на ограничении.
+        """
+        return self.update(**{field: Greatest(F(field) + delta, 0)})
+
+    def latest_per_author(self, limit):
+        """Оставляет не больше limit последних рецептов каждого автора.
+
+        Рецепты нумеруются окном ROW_NUMBER() по автору за один проход.
+        Django 3.2 не умеет фильтровать по оконной аннотации, поэтому
+        нумерованный запрос оборачивается в подзапрос.
+        """
+        ranked = self.annotate(position=Window(
+            expression=RowNumber(), partition_by=[F('author')],
+            order_by=F('id').desc()
+        )).order_by().values('id', 'position')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            'WHERE ranked.position <= %s', (*params, limit)))
+
+    def with_user_flags(self, user):
+        """Аннотирует флаги избранного, корзины и подписки на автора."""
+        if not user.is_authenticated:
+            false = Value(False, output_field=BooleanField())
+            return self.annotate(is_favorited=false,
+                                 is_in_shopping_cart=false,
+                                 author_is_subscribed=false)
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(Follow.objects.filter(
+                user=user, following=OuterRef('author'))),
+        )
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
     author = models.ForeignKey(
@@ -45,6 +108,14 @@ class Recipe(models.Model):
                               upload_to='recipes/images',
                               blank=True,
                               null=True)
+    image_digest = models.CharField('SHA-256 загруженной картинки',
+                                    max_length=64,
+                                    blank=True,
+                                    editable=False)
+    image_renditions = models.JSONField('Варианты изображения',
+                                        default=dict,
+                                        blank=True,
+                                        editable=False)
     text = models.TextField('Описание')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -58,14 +129,43 @@ class Recipe(models.Model):
         verbose_name='Тег'
     )
     cooking_time = models.IntegerField('Время приготовления')
+    favorites_count = models.PositiveIntegerField('Кол-во в избранном',
+                                                  default=0,
+                                                  editable=False,
+                                                  db_index=True)
+    shopping_carts_count = models.PositiveIntegerField('Кол-во в корзинах',
+                                                       default=0,
+                                                       editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+
+    COUNTER_FIELDS = ('favorites_count', 'shopping_carts_count')
+    BACKGROUND_FIELDS = COUNTER_FIELDS + ('image_renditions',)
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=('author', '-id'),
+                         name='recipe_author_id_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Счётчики меняются только F()-выражениями, а варианты изображения
+        # пишет фоновая обработка, поэтому обычное сохранение не должно
+        # затирать их значениями из памяти.
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.BACKGROUND_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 
 class AmountIngredient(models.Model):
     """Промежуточная модель для ингредиентов, с добавлением количества."""
@@ -84,6 +184,14 @@ class AmountIngredient(models.Model):
     class Meta:
         verbose_name = 'Количество'
         verbose_name_plural = 'Количество'
+        constraints = [
+            models.UniqueConstraint(fields=('recipe', 'ingredient'),
+                                    name='unique_recipe_ingredient'),
+        ]
+        indexes = [
+            models.Index(fields=('recipe', 'ingredient', 'amount'),
+                         name='amount_ingredient_cover_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -104,6 +212,10 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'following'),
+                                    name='unique_follow'),
+        ]
 
 
 class Favorite(models.Model):
@@ -124,6 +236,10 @@ class Favorite(models.Model):
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'recipe'),
+                                    name='unique_favorite'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.user.username} {self.recipe.name}'
@@ -147,6 +263,10 @@ class ShoppingCart(models.Model):
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзины'
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'recipe'),
+                                    name='unique_shopping_cart'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.user.username} {self.recipe.name}'
@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Ингредиенты загружены в обход save() (bulk_create, COPY): post_save не
+# приходит, а кеши справочника нужно сбросить. Отправителем передаётся
+# модель Ingredient.
+ingredients_loaded = Signal()
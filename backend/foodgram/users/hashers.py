@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 с числом итераций из PASSWORD_HASH_ITERATIONS.
+
+    Алгоритм тот же, что у стандартного хешера, поэтому старые хеши
+    проверяются, а при входе пересчитываются под текущую настройку.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
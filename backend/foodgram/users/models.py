@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
+from django.db.models.functions import Upper
 
 
 class User(AbstractUser):
@@ -26,6 +27,9 @@ class User(AbstractUser):
     class Meta:
         verbose_name = 'Пользователи'
         verbose_name_plural = 'Пользователи'
+        indexes = [
+            models.Index(Upper('email'), name='user_email_upper_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.username